@@ -0,0 +1,147 @@
+"""
+Headless version of the game system that plays many games in lockstep.
+
+Instead of playing one game at a time in a Python loop, Batch_game_system
+keeps a batch of boards in a single numpy array of shape
+(batch_size, rows, cols) and plays one move in every live game at once.
+Finished games are retired and their slot is immediately reused for a new
+game, until the requested number of games has been played.
+
+In this module, the boards use a signed representation:
+0 = no one played this space
+1 = Player 1 played here
+-1 = Player 2 played here
+so the board seen by a player is obtained by a simple sign flip.
+"""
+
+import numpy as np
+
+from interfaces import Game_system_interface
+from bitboard import generate_lines
+
+# Codes returned by Batch_game_system.check_for_endgame
+CONTINUE = 0
+PLAYER_1_WON = 1
+PLAYER_2_WON = 2
+DRAW = 3
+
+
+class Batch_game_system(Game_system_interface):
+    def __init__(self, player_1, player_2, batch_size=256, line_length=3):
+        """
+        Players that implement a play_batch(current_states) method get all
+        their boards at once, as an array of shape (n, rows, cols) from their
+        own perspective, and must return the new boards in the same format.
+        Other players are asked to play each board one by one, so they should
+        not rely on a per-game history (e.g. learning models).
+        """
+        self.player_1 = player_1
+        self.player_2 = player_2
+        self.batch_size = batch_size
+        self.line_length = line_length
+
+        self.player_1_scores = {"WINS": 0, "LOSSES": 0, "DRAWS": 0}
+        self.player_2_scores = {"WINS": 0, "LOSSES": 0, "DRAWS": 0}
+
+        self.board_dimensions = None
+        self.lines = None
+
+    def play_a_game(self, board_dimensions=(3, 3)):
+        """Plays a single game, see play_games"""
+        return self.play_games(1, board_dimensions)
+
+    def play_games(self, games_count, board_dimensions=(3, 3)):
+        """Plays games_count games, batch_size of them at the same time"""
+
+        self.set_board_dimensions(board_dimensions)
+        slots_count = min(self.batch_size, games_count)
+        boards = np.zeros((slots_count,) + self.board_dimensions, dtype=np.int8)
+        # Number of the player whose turn it is in each game
+        turns = np.random.randint(1, 3, size=slots_count).astype(np.int8)
+        live = np.ones(slots_count, dtype=bool)
+        games_started = slots_count
+
+        while live.any():
+            for player_nbr, player, sign in (
+                (1, self.player_1, 1),
+                (2, self.player_2, -1),
+            ):
+                movers = np.flatnonzero(live & (turns == player_nbr))
+                if movers.size == 0:
+                    continue
+                # Each player gets the boards of the games where it is their
+                # turn, converted to their own perspective
+                new_boards = self.play_for_player(player, boards[movers] * sign)
+                boards[movers] = new_boards * sign
+
+            turns[live] = 3 - turns[live]
+
+            live_games = np.flatnonzero(live)
+            results = self.check_for_endgame(boards[live_games])
+            finished = live_games[results != CONTINUE]
+            if finished.size == 0:
+                continue
+
+            self.record_results(results[results != CONTINUE])
+            live[finished] = False
+
+            # The slots of the finished games are refilled with new games
+            new_games = finished[: games_count - games_started]
+            if new_games.size:
+                boards[new_games] = 0
+                turns[new_games] = np.random.randint(1, 3, size=new_games.size)
+                live[new_games] = True
+                games_started += new_games.size
+
+        return True
+
+    def set_board_dimensions(self, board_dimensions):
+        """Precomputes the lines to check for the given board dimensions"""
+        board_dimensions = tuple(board_dimensions)
+        if board_dimensions != self.board_dimensions:
+            self.board_dimensions = board_dimensions
+            self.lines = np.array(generate_lines(board_dimensions, self.line_length))
+
+    def play_for_player(self, player, current_states):
+        """Asks player to play a move on each board of current_states"""
+        if hasattr(player, "play_batch"):
+            return player.play_batch(current_states)
+        return np.array([player.play(state.copy()) for state in current_states])
+
+    def check_for_endgame(self, boards):
+        """
+        Checks all the boards at once. Returns an array with one of the codes
+        CONTINUE, PLAYER_1_WON, PLAYER_2_WON or DRAW for each board.
+        """
+        flat_boards = boards.reshape(boards.shape[0], -1)
+        line_sums = flat_boards[:, self.lines].sum(axis=2)
+
+        results = np.full(boards.shape[0], CONTINUE, dtype=np.int8)
+        results[~(flat_boards == 0).any(axis=1)] = DRAW
+        results[(line_sums == -self.line_length).any(axis=1)] = PLAYER_2_WON
+        results[(line_sums == self.line_length).any(axis=1)] = PLAYER_1_WON
+        return results
+
+    def record_results(self, results):
+        """Adds the results of the finished games to the scores"""
+        player_1_wins = int(np.count_nonzero(results == PLAYER_1_WON))
+        player_2_wins = int(np.count_nonzero(results == PLAYER_2_WON))
+        draws = int(np.count_nonzero(results == DRAW))
+
+        self.player_1_scores["WINS"] += player_1_wins
+        self.player_1_scores["LOSSES"] += player_2_wins
+        self.player_1_scores["DRAWS"] += draws
+        self.player_2_scores["WINS"] += player_2_wins
+        self.player_2_scores["LOSSES"] += player_1_wins
+        self.player_2_scores["DRAWS"] += draws
+
+        for result in results:
+            if result == PLAYER_1_WON:
+                self.player_1.notify_game_result(1)
+                self.player_2.notify_game_result(0)
+            elif result == PLAYER_2_WON:
+                self.player_1.notify_game_result(0)
+                self.player_2.notify_game_result(1)
+            else:
+                self.player_1.notify_game_result(0.5)
+                self.player_2.notify_game_result(0.5)
@@ -0,0 +1,127 @@
+"""
+Measures how many games per second the game engine can play.
+Launch this script directly to compare the different engines available.
+"""
+
+import random
+from time import perf_counter
+
+import numpy as np
+
+from game_system import Game_system
+from batch_game_system import Batch_game_system
+from instrumentation import Game_instrumentation
+from random_ai import Random_AI
+
+
+def games_per_second(game_system, games_count=2000, board_dimensions=(3, 3)):
+    """Plays games_count games with game_system and returns the throughput"""
+    starting_time = perf_counter()
+    for i in range(games_count):
+        game_system.play_a_game(board_dimensions)
+    return games_count / (perf_counter() - starting_time)
+
+
+def compare_game_engines(
+    games_count=2000, board_dimensions=(3, 3), line_length=3, seed=0
+):
+    """
+    Compares the numpy engine of Game_system with the bitboard one, with two
+    random AIs playing against each other. Both engines are given the same
+    seed so they play exactly the same games.
+
+    Since both engines only check the lines going through the last move, the
+    endgame check is only a fraction of the time spent on each move, the
+    rest going to the players and to the board conversions. The bitboard
+    makes the check itself about 10 times faster on 3x3 and 4 times faster
+    on 15x15 with 5 in a row, but the games are only 1.2 to 1.5 times
+    faster overall.
+    This is why the bitboard is off by default: it is worth enabling when
+    the players are fast, e.g. Frozen_policy_AI, and Batch_game_system
+    should be used when the throughput matters most.
+    """
+    results = {}
+    for engine, use_bitboard in (("ndarray", False), ("bitboard", True)):
+        random.seed(seed)
+        np.random.seed(seed)
+        game_system = Game_system(
+            Random_AI(), Random_AI(), bitboard=use_bitboard, line_length=line_length
+        )
+        results[engine] = games_per_second(game_system, games_count, board_dimensions)
+
+        # The same games are played again to measure the endgame checks alone,
+        # since the instrumentation slows the games down
+        random.seed(seed)
+        np.random.seed(seed)
+        instrumentation = Game_instrumentation()
+        game_system = Game_system(
+            Random_AI(),
+            Random_AI(),
+            bitboard=use_bitboard,
+            line_length=line_length,
+            instrumentation=instrumentation,
+        )
+        games_per_second(game_system, games_count, board_dimensions)
+        snapshot = instrumentation.snapshot()
+        moves_count = sum(
+            summary["count"] for summary in snapshot["move_latency"].values()
+        )
+        check_time = snapshot["phase_times"]["endgame_check"] / moves_count
+        print(
+            f"{engine}: {results[engine]:.0f} games/sec, "
+            f"{check_time * 1e6:.2f} µs per endgame check"
+        )
+
+    print(f"Speedup: x{results['bitboard'] / results['ndarray']:.2f}")
+    return results
+
+
+def compare_batch_game_system(
+    games_count=20000, board_dimensions=(3, 3), batch_size=1024
+):
+    """
+    Compares the throughput of Game_system and Batch_game_system with two
+    random AIs playing against each other.
+    """
+    results = {}
+    game_system = Game_system(Random_AI(), Random_AI(), bitboard=True)
+    results["game_system"] = games_per_second(
+        game_system, games_count // 10, board_dimensions
+    )
+    print(f"Game_system: {results['game_system']:.0f} games/sec")
+
+    batch_game_system = Batch_game_system(Random_AI(), Random_AI(), batch_size)
+    starting_time = perf_counter()
+    batch_game_system.play_games(games_count, board_dimensions)
+    results["batch_game_system"] = games_count / (perf_counter() - starting_time)
+    print(f"Batch_game_system: {results['batch_game_system']:.0f} games/sec")
+
+    print(f"Speedup: x{results['batch_game_system'] / results['game_system']:.2f}")
+    return results
+
+
+def profile_game_system(games_count=2000, board_dimensions=(3, 3)):
+    """
+    Measures where the time goes when two random AIs play against each other,
+    and the overhead of the instrumentation itself.
+    """
+    game_system = Game_system(Random_AI(), Random_AI())
+    throughput = games_per_second(game_system, games_count, board_dimensions)
+    print(f"Without instrumentation: {throughput:.0f} games/sec")
+
+    instrumentation = Game_instrumentation()
+    game_system = Game_system(
+        Random_AI(), Random_AI(), instrumentation=instrumentation
+    )
+    throughput = games_per_second(game_system, games_count, board_dimensions)
+    print(f"With instrumentation: {throughput:.0f} games/sec")
+    print(instrumentation.snapshot())
+    return instrumentation
+
+
+if __name__ == "__main__":
+    compare_game_engines()
+    # Gomoku-sized variant
+    compare_game_engines(games_count=200, board_dimensions=(15, 15), line_length=5)
+    compare_batch_game_system()
+    profile_game_system()
@@ -0,0 +1,110 @@
+"""
+Bitboard representation of the game, used by Game_system as a faster
+alternative to scanning the numpy board for alignments.
+
+Each player's marks are stored as an integer bitmask where bit n is set if
+the player checked the n-th box of the flattened board. Every possible
+alignment on the board is precomputed as a mask as well, so checking if a
+player won only takes a few integer operations.
+"""
+
+
+def generate_lines(board_dimensions=(3, 3), line_length=3):
+    """
+    Returns every alignment of line_length boxes that fits on a board of the
+    given dimensions.
+
+    Each line is a tuple containing the indices of its boxes on the flattened
+    board. Lines are ordered by their first box, then by direction
+    (horizontal, vertical, diagonal, anti-diagonal).
+    """
+    rows, cols = board_dimensions
+    directions = ((0, 1), (1, 0), (1, 1), (1, -1))
+    lines = []
+
+    for row in range(rows):
+        for col in range(cols):
+            for d_row, d_col in directions:
+                last_row = row + d_row * (line_length - 1)
+                last_col = col + d_col * (line_length - 1)
+                if not (0 <= last_row < rows and 0 <= last_col < cols):
+                    continue
+                lines.append(
+                    tuple(
+                        (row + d_row * step) * cols + col + d_col * step
+                        for step in range(line_length)
+                    )
+                )
+    return lines
+
+
+class Bitboard:
+    def __init__(self, board_dimensions=(3, 3), line_length=3):
+        self.board_dimensions = tuple(board_dimensions)
+        self.line_length = line_length
+
+        cells_count = self.board_dimensions[0] * self.board_dimensions[1]
+        self.full_mask = (1 << cells_count) - 1
+
+        # All the line masks are precomputed, then indexed by box so that
+        # only the lines going through the last move need to be checked
+        self.line_masks = []
+        self.line_masks_by_cell = [[] for _ in range(cells_count)]
+        for line in generate_lines(self.board_dimensions, line_length):
+            mask = 0
+            for cell in line:
+                mask |= 1 << cell
+            self.line_masks.append(mask)
+            for cell in line:
+                self.line_masks_by_cell[cell].append(mask)
+
+        self.reset()
+
+    def reset(self):
+        """Empties the board before a new game"""
+        # player_masks is indexed with the player number, index 0 is unused
+        self.player_masks = [0, 0, 0]
+        self.last_move = None
+        self.last_player = None
+
+    def play(self, cell, player_nbr):
+        """Checks the box at index 'cell' of the flattened board for player_nbr"""
+        self.player_masks[player_nbr] |= 1 << cell
+        self.last_move = cell
+        self.last_player = player_nbr
+
+    def load_board(self, board):
+        """
+        Sets the bitmasks from a numpy board using the central representation
+        of Game_system (0 = empty, 1 = Player 1, -1 = Player 2).
+        """
+        self.reset()
+        for cell, value in enumerate(board.flatten()):
+            if value == 1:
+                self.player_masks[1] |= 1 << cell
+            elif value == -1:
+                self.player_masks[2] |= 1 << cell
+
+    def check_for_endgame(self):
+        """
+        Checks if the game is over after the last move played.
+
+        Returns the number of the player who won, "DRAW" or "CONTINUE", like
+        Game_system.check_for_endgame. If no move was registered through
+        play(), every line is checked for both players.
+        """
+        if self.last_move is None:
+            for player_nbr in (1, 2):
+                player_mask = self.player_masks[player_nbr]
+                for line_mask in self.line_masks:
+                    if player_mask & line_mask == line_mask:
+                        return player_nbr
+        else:
+            player_mask = self.player_masks[self.last_player]
+            for line_mask in self.line_masks_by_cell[self.last_move]:
+                if player_mask & line_mask == line_mask:
+                    return self.last_player
+
+        if self.player_masks[1] | self.player_masks[2] == self.full_mask:
+            return "DRAW"
+        return "CONTINUE"
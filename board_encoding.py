@@ -0,0 +1,175 @@
+"""
+Compact integer codes for 3x3 boards, used by the tabular models to index
+their tables.
+
+Each box of a board seen from a player's perspective takes the values
+-1 (opponent), 0 (empty) or 1 (player). These values are mapped to the
+digits 2, 0 and 1, and the code of a board is the base-3 number whose n-th
+digit is the n-th box of the flattened board. There are thus 3^9 = 19683
+possible codes, so a table indexed by code can simply be a numpy array.
+"""
+
+import numpy as np
+
+from bitboard import generate_lines
+from persistence import atomic_write
+
+CELLS_COUNT = 9
+STATES_COUNT = 3**CELLS_COUNT
+POWERS_OF_3 = 3 ** np.arange(CELLS_COUNT, dtype=np.int64)
+
+
+def encode_board(board) -> int:
+    """Returns the code of a 3x3 board"""
+    return int((np.asarray(board).ravel() % 3) @ POWERS_OF_3)
+
+
+def encode_boards(boards) -> np.array:
+    """Returns the codes of an array of boards of shape (n, 3, 3) or (n, 9)"""
+    boards = np.asarray(boards).reshape(-1, CELLS_COUNT)
+    return (boards % 3) @ POWERS_OF_3
+
+
+def decode_board(code) -> np.array:
+    """Returns the 3x3 board corresponding to a code"""
+    return decode_boards(np.array([code]))[0]
+
+
+def decode_boards(codes) -> np.array:
+    """Returns the boards corresponding to an array of codes, with shape
+    (n, 3, 3)"""
+    digits = (np.asarray(codes)[:, np.newaxis] // POWERS_OF_3) % 3
+    boards = digits.astype(np.int8)
+    boards[boards == 2] = -1
+    return boards.reshape(-1, 3, 3)
+
+
+# The 8 symmetries of the square (rotations and reflections), given as
+# permutations of the boxes: the board transformed by a symmetry is
+# board.ravel()[permutation]
+D4_PERMUTATIONS = np.array(
+    [
+        np.rot90(np.arange(CELLS_COUNT).reshape(3, 3), rotation).ravel()
+        for rotation in range(4)
+    ]
+    + [
+        np.rot90(np.arange(CELLS_COUNT).reshape(3, 3).T, rotation).ravel()
+        for rotation in range(4)
+    ]
+)
+
+canonical_code_table = None
+
+
+def canonical_codes(codes) -> np.array:
+    """
+    Returns the canonical code of each code given, i.e. the smallest code
+    among the 8 boards obtained by rotating or reflecting the board. All the
+    boards of a same symmetry class share the same canonical code.
+    """
+    global canonical_code_table
+    if canonical_code_table is None:
+        # The table is computed once for all the possible codes
+        all_boards = decode_boards(np.arange(STATES_COUNT)).reshape(-1, CELLS_COUNT)
+        symmetric_codes = [
+            encode_boards(all_boards[:, permutation])
+            for permutation in D4_PERMUTATIONS
+        ]
+        canonical_code_table = np.min(symmetric_codes, axis=0)
+    return canonical_code_table[codes]
+
+
+winner_table = None
+
+
+def winners(codes) -> np.array:
+    """
+    Returns the winner of each board given by its code: 1 or -1 if one of
+    the players has 3 boxes in a row, 0 otherwise. If both players have an
+    alignment, the winner is the player whose line starts on the first box
+    of the board, like when the boxes are checked in order.
+    """
+    global winner_table
+    if winner_table is None:
+        # The table is computed once for all the possible codes
+        all_boards = decode_boards(np.arange(STATES_COUNT)).reshape(-1, CELLS_COUNT)
+        # generate_lines sorts the lines by their first box
+        lines = np.array(generate_lines((3, 3), 3))
+        line_sums = all_boards[:, lines].sum(axis=2, dtype=np.int8)
+        aligned_lines = np.abs(line_sums) == 3
+        first_aligned_line = np.argmax(aligned_lines, axis=1)
+        winner_table = np.sign(
+            line_sums[np.arange(STATES_COUNT), first_aligned_line]
+        )
+        winner_table[~aligned_lines.any(axis=1)] = 0
+    return winner_table[codes]
+
+# Precomputed transitions between the codes, used by the tabular models to
+# evaluate all the positions reachable from a state at once. The arrays are
+# stored in a compressed sparse row (CSR) layout: the successors of the state
+# with code c are successor_codes[successor_ptr[c]:successor_ptr[c + 1]]
+SUCCESSOR_GRAPH_VERSION = 1
+SUCCESSOR_GRAPH_PATH = f"training_data/successor_graph_v{SUCCESSOR_GRAPH_VERSION}.npz"
+
+successor_graph_arrays = None
+
+
+def build_successor_graph():
+    """
+    Builds the successor graph of all the codes, as a dictionary of arrays:
+    - reply_ptr, reply_codes: the states that can follow a state after the
+      opponent plays in one of its empty boxes
+    - followup_ptr, followup_codes: the states that can follow a state after
+      the opponent plays and the player plays back, i.e. the union of the
+      player's possible moves after each reply of the opponent. The states
+      are sorted by the box played by the opponent, then by the box played by
+      the player.
+    """
+    empty_boxes = decode_boards(np.arange(STATES_COUNT)).reshape(-1, CELLS_COUNT) == 0
+
+    # np.nonzero returns the indices in row-major order, so the successors are
+    # grouped by state as required by the CSR layout
+    states, reply_boxes = np.nonzero(empty_boxes)
+    reply_codes = states + 2 * POWERS_OF_3[reply_boxes]
+    reply_ptr = np.zeros(STATES_COUNT + 1, dtype=np.int64)
+    np.cumsum(empty_boxes.sum(axis=1), out=reply_ptr[1:])
+
+    followup_pairs = (
+        empty_boxes[:, :, np.newaxis]
+        & empty_boxes[:, np.newaxis, :]
+        & ~np.eye(CELLS_COUNT, dtype=bool)
+    )
+    states, reply_boxes, followup_boxes = np.nonzero(followup_pairs)
+    followup_codes = (
+        states + 2 * POWERS_OF_3[reply_boxes] + POWERS_OF_3[followup_boxes]
+    )
+    followup_ptr = np.zeros(STATES_COUNT + 1, dtype=np.int64)
+    np.cumsum(followup_pairs.sum(axis=(1, 2)), out=followup_ptr[1:])
+
+    return {
+        "reply_ptr": reply_ptr,
+        "reply_codes": reply_codes.astype(np.int32),
+        "followup_ptr": followup_ptr,
+        "followup_codes": followup_codes.astype(np.int32),
+    }
+
+
+def successor_graph():
+    """
+    Returns the successor graph (see build_successor_graph). It is built once
+    and cached in SUCCESSOR_GRAPH_PATH, so that the next runs only have to
+    load it.
+    """
+    global successor_graph_arrays
+    if successor_graph_arrays is None:
+        try:
+            with np.load(SUCCESSOR_GRAPH_PATH) as saved_graph:
+                successor_graph_arrays = dict(saved_graph)
+        except (OSError, ValueError):
+            # No cache yet, or a file that cannot be read
+            successor_graph_arrays = build_successor_graph()
+            atomic_write(
+                SUCCESSOR_GRAPH_PATH,
+                lambda f: np.savez(f, **successor_graph_arrays),
+            )
+    return successor_graph_arrays
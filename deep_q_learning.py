@@ -1,18 +1,37 @@
 """
 Implementation of the deep Q-Learning model for tic-tac-toe.
 """
+import contextlib
+import queue
 import random
+import threading
 
 import numpy as np
 import keras
 
 from interfaces import Player_interface
+from replay_memory import Replay_memory
 
 class DeepQLearningAI(Player_interface):
 
     dnn = None
+    # Weights and biases of the layers of dnn, mirrored as numpy arrays so that
+    # the moves can be chosen without calling Keras. See predict_q_values
+    weights = None
+    weights_version = 0 # Version of the weights published by the trainer
+    trainer = None # Background_trainer shared by all the instances, if any
 
-    def __init__(self, alpha=0.01, gamma=0.5, epsilon=0.5):
+    def __init__(
+        self,
+        alpha=0.01,
+        gamma=0.5,
+        epsilon=0.5,
+        memory_capacity=10000,
+        minibatch_size=256,
+        training_steps=8,
+        prioritized_replay=False,
+        background_training=False,
+    ):
         self.is_AI = True
         self.learning = True
         self.alpha = alpha # Learning rate
@@ -22,7 +41,15 @@ class DeepQLearningAI(Player_interface):
         self.games_played = 0 # Count of games played since the game was launched
         self.batch_size = 100 # Defines how often we should retrain the network (in games count)
 
-        self.replayed_memory_buffer = [] # Memory buffer used during training
+        # Memory of the last memory_capacity moves played, used as training
+        # data. Each training runs on training_steps minibatches of
+        # minibatch_size moves sampled from the memory, uniformly or by
+        # priority (see replay_memory.py), so a move can be used for several
+        # trainings
+        self.replay_memory = Replay_memory(memory_capacity)
+        self.minibatch_size = minibatch_size
+        self.training_steps = training_steps
+        self.prioritized_replay = prioritized_replay
         self.game_history = []
 
         if not DeepQLearningAI.dnn:
@@ -32,6 +59,15 @@ class DeepQLearningAI(Player_interface):
             except OSError:
                 # If no file was found, we generate a new network
                 DeepQLearningAI.dnn = self.setup_neural_network()
+            self.refresh_weights()
+
+        # If background_training is True, the network is trained continuously
+        # by a background thread, which receives the moves played at the end
+        # of each game. The new weights it publishes are used from the next
+        # game on. See Background_trainer for more details
+        self.background_training = background_training
+        if background_training and DeepQLearningAI.trainer is None:
+            DeepQLearningAI.trainer = Background_trainer(self, memory_capacity)
                 
     
     def __str__(self):
@@ -63,16 +99,9 @@ class DeepQLearningAI(Player_interface):
             # Exploit
             # Play the best known move according to the model,
             # after filtering out any illegal move.
-            current_state_vector = current_state.flatten()
-            q_values = DeepQLearningAI.dnn.predict(np.array([current_state_vector]), verbose=0)[0]
-            ordered_q_values = np.flip(np.argsort(q_values))
-            for index in ordered_q_values:
-                if self.move_is_valid(current_state, index):
-                    move = current_state_vector
-                    move[index] = 1
-                    move = np.reshape(move, (3, 3))
-                    break
-                    
+            action = self.get_best_actions(current_state.reshape(1, -1))[0]
+            move = current_state.copy()
+            move.flat[action] = 1
 
 
         current_state_vector = current_state.flatten()
@@ -82,6 +111,41 @@ class DeepQLearningAI(Player_interface):
         self.game_history.append(move_tuple)
         return move
 
+    def play_batch(self, current_states: np.array) -> np.array:
+        """
+        Plays a move on each board of current_states, an array of shape
+        (n, 3, 3) using the same values as play(), and returns the new states
+        of the boards. Each move is explored with the probability epsilon,
+        like in play().
+
+        Since the games of a batch cannot be told apart at the end of the
+        games, the moves played are not added to the history used to train
+        the model.
+        """
+        flat_states = current_states.reshape(current_states.shape[0], -1)
+        actions = self.get_best_actions(flat_states)
+        if self.learning:
+            # Each empty box gets a random score, the box with the highest
+            # score is played
+            explore = np.random.random(len(flat_states)) < self.epsilon
+            random_scores = np.random.random(flat_states.shape)
+            random_scores[flat_states != 0] = -1
+            actions[explore] = np.argmax(random_scores[explore], axis=1)
+
+        new_states = flat_states.copy()
+        new_states[np.arange(len(new_states)), actions] = 1
+        return new_states.reshape(current_states.shape)
+
+    def get_best_actions(self, flat_states):
+        """
+        Returns the legal action with the highest Q-value for each of the
+        flattened states given, as an array of shape (n, 9).
+        """
+        q_values = self.predict_q_values(flat_states)
+        # The boxes that are already checked can never be chosen
+        q_values[flat_states != 0] = -np.inf
+        return np.argmax(q_values, axis=1)
+
     def get_all_possible_moves(self, current_board):
         """
         Returns all possible moves given the current state.
@@ -123,42 +187,81 @@ class DeepQLearningAI(Player_interface):
         """
         Saves the trained model in the training_data folder.
         """
-        DeepQLearningAI.dnn.save("training_data/deep_q_learning.keras")
+        # The network must not be saved while it is being trained
+        with self.network_lock():
+            DeepQLearningAI.dnn.save("training_data/deep_q_learning.keras")
     
     def train_model(self):
         """
-        Trains the model using the replayed memory buffer as training data.
+        Trains the model on minibatches sampled from the replay memory.
         """
 
-        # First we shuffle the memory buffer in order to avoid overfitting
-        np.random.shuffle(self.replayed_memory_buffer)
-        X_train = []
-        y_train = []
+        # The background trainer may be training the same network
+        with self.network_lock():
+            for _ in range(self.training_steps):
+                self.train_step(self.replay_memory)
+            self.refresh_weights()
 
-        for experience in self.replayed_memory_buffer:
-            q_values = DeepQLearningAI.dnn.predict(np.array([experience[0]]), verbose=0)
-            q_target = experience[3]
-            q_values[0][experience[1]] = q_target
-            X_train.append(experience[0])
-            y_train.append(q_values.reshape(9))
-        
-        DeepQLearningAI.dnn.fit(np.array(X_train), np.array(y_train))
+    def network_lock(self):
+        """
+        Returns the lock that must be held to use the network while the
+        background trainer is running, or a context that does nothing
+        otherwise.
+        """
+        if DeepQLearningAI.trainer is not None:
+            return DeepQLearningAI.trainer.lock
+        return contextlib.nullcontext()
 
-        self.replayed_memory_buffer = []
+    def train_step(self, replay_memory):
+        """
+        Trains the network on a minibatch sampled from replay_memory.
+        """
+        indices, states, actions, _, q_targets, weights = replay_memory.sample(
+            self.minibatch_size, self.prioritized_replay
+        )
+        X_train = states.astype(np.float32)
 
+        # The Q-values of all the states are predicted in a single call,
+        # then the Q-value of the action played in each state is replaced
+        # by its target
+        y_train = DeepQLearningAI.dnn.predict(X_train, verbose=0)
+        minibatch_range = np.arange(len(X_train))
+        errors = q_targets - y_train[minibatch_range, actions]
+        y_train[minibatch_range, actions] = q_targets
 
-    
-    def move_is_valid(self, current_state: np.array, move: int):
+        DeepQLearningAI.dnn.fit(X_train, y_train, sample_weight=weights, verbose=0)
+        if self.prioritized_replay:
+            replay_memory.update_priorities(indices, errors)
+
+    def refresh_weights(self):
         """
-        Returns True if the move passed as a parameter is valid given the
-        current state, False otherwise.
+        Copies the weights of the network into numpy arrays, to be called
+        each time the network is trained or loaded.
+        """
+        DeepQLearningAI.weights = [
+            np.asarray(weights, dtype=np.float32)
+            for weights in DeepQLearningAI.dnn.get_weights()
+        ]
 
-        current_state: current board given as a 2D numpy array
-        move: index of the box to play on the flattened board vector.
+    def predict_q_values(self, states):
         """
-        if current_state.flatten()[move] == 0:
-            return True
-        return False
+        Computes the Q-values of an array of flattened states of shape (n, 9)
+        with numpy, using the mirrored weights of the network.
+
+        Much faster than dnn.predict for a few states, as the network is small
+        enough for its evaluation to take less time than the overhead of a
+        Keras call. The layers are those of setup_neural_network: dense layers
+        with a relu activation, except for the last one which is linear.
+        """
+        activations = np.asarray(states, dtype=np.float32)
+        layers_count = len(DeepQLearningAI.weights) // 2
+        for layer_index in range(layers_count):
+            kernel = DeepQLearningAI.weights[2 * layer_index]
+            bias = DeepQLearningAI.weights[2 * layer_index + 1]
+            activations = activations @ kernel + bias
+            if layer_index < layers_count - 1:
+                activations = np.maximum(activations, 0)
+        return activations
 
     def notify_game_result(self, result) -> None:
         """
@@ -167,21 +270,133 @@ class DeepQLearningAI(Player_interface):
         if self.learning:
             # Here we loop starting from the last state
             history_from_end = list(reversed(self.game_history))
+            experiences = []
             for state_index in range(len(history_from_end)):
                 game_move =  history_from_end[state_index]    
                 reward = result * (self.gamma**state_index)
-                tuple_to_append = (game_move[0],
-                                game_move[1],
-                                game_move[2],
-                                reward)       
-                self.replayed_memory_buffer.append(tuple_to_append)    
-            
+                experiences.append((game_move[0],
+                                    game_move[1],
+                                    game_move[2],
+                                    reward))
 
             self.games_played += 1
-            if self.games_played % self.batch_size == 0:
-                print("Training...")
-                self.train_model()
+            if self.background_training:
+                DeepQLearningAI.trainer.add_experiences(experiences)
+            else:
+                for experience in experiences:
+                    self.replay_memory.add(*experience)
+                # The games played with play_batch are not recorded, so the
+                # memory may not hold a whole minibatch yet
+                if (
+                    self.games_played % self.batch_size == 0
+                    and len(self.replay_memory) >= self.minibatch_size
+                ):
+                    print("Training...")
+                    self.train_model()
         self.game_history = []
 
+        if self.background_training:
+            # Between two games, the last weights published by the trainer
+            # replace the ones used to choose the moves
+            version, weights = DeepQLearningAI.trainer.snapshot
+            if version != DeepQLearningAI.weights_version:
+                DeepQLearningAI.weights = weights
+                DeepQLearningAI.weights_version = version
+
+    def stop_background_training(self):
+        """
+        Stops the background trainer, after which the instances created with
+        background_training=True must not be used anymore.
+        """
+        if DeepQLearningAI.trainer is not None:
+            DeepQLearningAI.trainer.stop()
+            # The last weights published become those of all the instances
+            version, weights = DeepQLearningAI.trainer.snapshot
+            DeepQLearningAI.weights = weights
+            DeepQLearningAI.weights_version = version
+            DeepQLearningAI.trainer = None
+
+
+class Background_trainer:
+    def __init__(self, model, memory_capacity=10000, publish_every_steps=10):
+        """
+        Trains the network of DeepQLearningAI in a background thread, using
+        the hyperparameters of 'model'.
+
+        The actors (the DeepQLearningAI instances) put the moves of each game
+        in a queue, from which the thread fills its own replay memory. As
+        soon as the memory contains a minibatch, the thread trains the network
+        on minibatches without interruption, and publishes a copy of the
+        weights every publish_every_steps steps. The actors choose their moves
+        with the numpy copy of the weights, so they never wait for Keras, and
+        pick the new weights up between two games.
+
+        A thread is used rather than a process so that the network is shared:
+        Keras releases the GIL during the training, so the games and the
+        training still run at the same time.
+        """
+        self.model = model
+        self.replay_memory = Replay_memory(memory_capacity)
+        self.publish_every_steps = publish_every_steps
+        self.experiences = queue.Queue()
+        self.lock = threading.Lock() # Held while the network is used
+        self.steps = 0
+        # Version and numpy copy of the last weights published, replaced as a
+        # whole so that the actors never see a partial update
+        self.snapshot = (DeepQLearningAI.weights_version, DeepQLearningAI.weights)
+
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add_experiences(self, experiences):
+        """Called by the actors with the moves of a game, as (state, action,
+        next state, reward) tuples"""
+        self.experiences.put(experiences)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            # The thread only waits for new moves when it cannot train yet
+            self.collect_experiences(
+                wait=len(self.replay_memory) < self.model.minibatch_size
+            )
+            if len(self.replay_memory) < self.model.minibatch_size:
+                continue
+
+            with self.lock:
+                self.model.train_step(self.replay_memory)
+                self.steps += 1
+                if self.steps % self.publish_every_steps == 0:
+                    self.publish_weights()
+
+    def collect_experiences(self, wait):
+        """Moves all the experiences waiting in the queue to the replay
+        memory"""
+        try:
+            if wait:
+                experiences = self.experiences.get(timeout=0.1)
+            else:
+                experiences = self.experiences.get_nowait()
+            while True:
+                for experience in experiences:
+                    self.replay_memory.add(*experience)
+                experiences = self.experiences.get_nowait()
+        except queue.Empty:
+            return
+
+    def publish_weights(self):
+        weights = [
+            np.array(weights, dtype=np.float32)
+            for weights in DeepQLearningAI.dnn.get_weights()
+        ]
+        self.snapshot = (self.snapshot[0] + 1, weights)
+
+    def stop(self):
+        """Stops the thread and publishes the last weights"""
+        self.stop_event.set()
+        self.thread.join()
+        with self.lock:
+            self.publish_weights()
+
 
     
\ No newline at end of file
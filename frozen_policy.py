@@ -0,0 +1,151 @@
+"""
+Frozen policies: the moves chosen by a trained model in every position of a
+3x3 game, compiled once into a lookup table.
+
+export_policy asks a model (QLearningAI, Improved_q_learning,
+DeepQLearningAI...) for its best move in every position that a player can
+face in a game, and saves the chosen boxes as an array indexed by the code
+of the position (see board_encoding.py). Frozen_policy_AI then plays these
+moves with a single lookup per move, without importing the model that
+produced them.
+"""
+
+import random
+
+import numpy as np
+
+from interfaces import Player_interface
+from persistence import atomic_write
+from board_encoding import (
+    CELLS_COUNT,
+    STATES_COUNT,
+    POWERS_OF_3,
+    encode_board,
+    encode_boards,
+    decode_boards,
+    successor_graph,
+    winners,
+)
+
+FROZEN_POLICY_PATH = "training_data/frozen_policy.npy"
+
+# Attributes set on the models during the export so that they only play their
+# best known move, and attributes containing the moves they played
+EXPLOITATION_SETTINGS = {
+    "learning": False,
+    "explore": False,
+    "always_explore": False,
+}
+HISTORY_ATTRIBUTES = ("history", "moves_history", "game_history")
+
+
+def positions_to_play():
+    """
+    Returns the codes of all the positions in which a player has to play
+    during a game, whichever player started.
+    """
+    # Imported here so that Frozen_policy_AI does not need the solver
+    from solver import reachable_states
+
+    # The empty board, the first move of the opponent, and every reply of
+    # the opponent to a move of the player that does not end the game
+    positions = [np.zeros(1, dtype=np.int64), 2 * POWERS_OF_3]
+    graph = successor_graph()
+    states = reachable_states()
+    states = states[winners(states) == 0]
+    reply_ptr = graph["reply_ptr"]
+    for state in states:
+        positions.append(graph["reply_codes"][reply_ptr[state]:reply_ptr[state + 1]])
+    positions = np.unique(np.concatenate(positions))
+
+    empty_counts = (decode_boards(positions) == 0).sum(axis=(1, 2))
+    return positions[(winners(positions) == 0) & (empty_counts > 0)]
+
+
+def export_policy(model, path=FROZEN_POLICY_PATH):
+    """
+    Saves the move played by the model in each position as a .npy array of
+    STATES_COUNT int8, giving the index of the box played on the flattened
+    board, or -1 for the positions that cannot be reached in a game.
+
+    The exploration of the model is disabled during the export, and the
+    moves played are removed from its history afterwards.
+    """
+    positions = positions_to_play()
+    boards = decode_boards(positions)
+
+    saved_settings = {
+        attribute: getattr(model, attribute)
+        for attribute in EXPLOITATION_SETTINGS
+        if hasattr(model, attribute)
+    }
+    for attribute in saved_settings:
+        setattr(model, attribute, EXPLOITATION_SETTINGS[attribute])
+    try:
+        if hasattr(model, "play_batch"):
+            new_boards = model.play_batch(boards.copy())
+        else:
+            new_boards = np.array([model.play(board.copy()) for board in boards])
+    finally:
+        for attribute, value in saved_settings.items():
+            setattr(model, attribute, value)
+        for attribute in HISTORY_ATTRIBUTES:
+            if hasattr(model, attribute):
+                setattr(model, attribute, [])
+
+    # The box played is the only one that changed
+    flat_boards = boards.reshape(-1, CELLS_COUNT)
+    changed_boxes = np.asarray(new_boards).reshape(-1, CELLS_COUNT) != flat_boards
+    if not (changed_boxes.sum(axis=1) == 1).all():
+        raise ValueError("The model must play exactly one move in each position")
+
+    policy = np.full(STATES_COUNT, -1, dtype=np.int8)
+    policy[positions] = np.argmax(changed_boxes, axis=1)
+    atomic_write(path, lambda policy_file: np.save(policy_file, policy))
+    return policy
+
+
+class Frozen_policy_AI(Player_interface):
+    def __init__(self, policy_path=FROZEN_POLICY_PATH):
+        """
+        Plays the moves of a policy saved by export_policy. In the positions
+        that are not in the policy, which can only happen if the opponent
+        broke the rules, a random move is played.
+        """
+        self.is_AI = True
+        self.policy = np.load(policy_path)
+
+    def __str__(self):
+        return "frozen policy"
+
+    def play(self, current_state):
+        move = self.policy[encode_board(current_state)]
+        new_state = current_state.copy()
+        if move < 0:
+            move = random.choice(np.flatnonzero(new_state.ravel() == 0))
+        new_state.flat[move] = 1
+        return new_state
+
+    def play_batch(self, current_states):
+        """
+        Plays the move of the policy on each board of current_states, an
+        array of shape (n, 3, 3). Returns the new states of the boards.
+        """
+        flat_states = current_states.reshape(current_states.shape[0], -1).copy()
+        moves = self.policy[encode_boards(flat_states)]
+        for game_index in np.flatnonzero(moves < 0):
+            moves[game_index] = random.choice(
+                np.flatnonzero(flat_states[game_index] == 0)
+            )
+        flat_states[np.arange(flat_states.shape[0]), moves] = 1
+        return flat_states.reshape(current_states.shape)
+
+    def notify_game_result(self, result):
+        return
+
+
+if __name__ == "__main__":
+    from q_learning import QLearningAI
+
+    export_policy(QLearningAI())
+    print(f"Saved the policy of the Q-learning model in {FROZEN_POLICY_PATH}")
@@ -0,0 +1,157 @@
+"""
+Compact binary format used to record the games played by Game_system.
+
+A record file starts with an 8-byte header: the magic bytes b"TTTR", the
+version of the format, the number of rows and columns of the board, and a
+reserved byte. It is followed by fixed-size records, one per game:
+- the number of the player who started (1 byte)
+- the number of moves played (1 byte)
+- the index of each box played on the flattened board, in order (1 byte per
+  box of the board, unused bytes are set to 0)
+- the result of the game: 1 or 2 for the winner, 0 for a draw (1 byte)
+A 3x3 game thus takes 12 bytes. Since the records have a fixed size, the
+file can be memory-mapped as a numpy array and read without converting the
+games to Python objects.
+"""
+
+import os
+
+import numpy as np
+
+MAGIC = b"TTTR"
+FORMAT_VERSION = 1
+HEADER_SIZE = 8
+
+
+def record_dtype(board_dimensions):
+    """Returns the numpy dtype of a record for the given board dimensions"""
+    cells_count = board_dimensions[0] * board_dimensions[1]
+    return np.dtype(
+        [
+            ("starting_player", np.uint8),
+            ("moves_count", np.uint8),
+            ("moves", np.uint8, (cells_count,)),
+            ("result", np.uint8),
+        ]
+    )
+
+
+def read_header(header):
+    """Checks the header of a record file and returns the board dimensions"""
+    if len(header) != HEADER_SIZE or header[:4] != MAGIC:
+        raise ValueError("Not a game record file")
+    if header[4] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported game record version: {header[4]}")
+    return (header[5], header[6])
+
+
+class Game_record_writer:
+    def __init__(self, path, board_dimensions=(3, 3), buffer_size=1 << 16):
+        """
+        Opens the record file at path, or creates it if it does not exist.
+        New games are appended at the end of the file, through a buffer of
+        buffer_size bytes.
+        """
+        self.board_dimensions = tuple(board_dimensions)
+        self.cells_count = self.board_dimensions[0] * self.board_dimensions[1]
+        if self.cells_count > 255:
+            raise ValueError("Boards with more than 255 boxes cannot be recorded")
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as record_file:
+                file_dimensions = read_header(record_file.read(HEADER_SIZE))
+            if file_dimensions != self.board_dimensions:
+                raise ValueError("The record file uses other board dimensions")
+            self.file = open(path, "ab", buffering=buffer_size)
+        else:
+            self.file = open(path, "wb", buffering=buffer_size)
+            self.file.write(
+                MAGIC + bytes((FORMAT_VERSION,) + self.board_dimensions + (0,))
+            )
+
+    def record_game(self, starting_player, moves, result, board_dimensions=None):
+        """
+        Appends a game to the file. moves is the list of the boxes played
+        (indices on the flattened board) and result is the value returned by
+        Game_system.check_for_endgame at the end of the game. If the
+        dimensions of the board are given, they must be those of the file.
+        """
+        if (
+            board_dimensions is not None
+            and tuple(board_dimensions) != self.board_dimensions
+        ):
+            raise ValueError("The game was played on a board of other dimensions")
+        if len(moves) > self.cells_count:
+            raise ValueError("A game cannot have more moves than boxes")
+
+        result_code = 0 if result == "DRAW" else result
+        self.file.write(
+            bytes((starting_player, len(moves)))
+            + bytes(moves)
+            + bytes(self.cells_count - len(moves))
+            + bytes((result_code,))
+        )
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+class Game_record_reader:
+    def __init__(self, path):
+        """Memory-maps the record file at path"""
+        with open(path, "rb") as record_file:
+            self.board_dimensions = read_header(record_file.read(HEADER_SIZE))
+        dtype = record_dtype(self.board_dimensions)
+
+        if os.path.getsize(path) - HEADER_SIZE < dtype.itemsize:
+            self.records = np.zeros(0, dtype=dtype)
+        else:
+            # A game that was being written when the file was read is ignored
+            games_count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+            self.records = np.memmap(
+                path,
+                dtype=dtype,
+                mode="r",
+                offset=HEADER_SIZE,
+                shape=(games_count,),
+            )
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        """Returns the starting player, the moves played (as a numpy array) and
+        the result (1, 2 or "DRAW") of the game at index"""
+        record = self.records[index]
+        result = int(record["result"])
+        return (
+            int(record["starting_player"]),
+            record["moves"][: record["moves_count"]],
+            result if result else "DRAW",
+        )
+
+    def __iter__(self):
+        for index in range(len(self.records)):
+            yield self[index]
+
+    @property
+    def results(self):
+        """Results of all the games, as an array where draws are 0"""
+        return self.records["result"]
+
+    @property
+    def starting_players(self):
+        return self.records["starting_player"]
+
+    @property
+    def moves_counts(self):
+        return self.records["moves_count"]
@@ -0,0 +1,388 @@
+"""
+Asyncio server hosting many games at the same time, each client playing
+against an AI.
+
+The clients and the server exchange JSON messages, one per line.
+Messages sent by the client:
+- {"type": "new_game", "opponent": "random", "board_dimensions": [3, 3],
+   "line_length": 3} starts a new game. opponent is one of the keys of
+   OPPONENTS, the other fields are optional. board_dimensions contains two
+   integers between 1 and MAX_BOARD_DIMENSION, and line_length is at most
+   the largest of them.
+- {"type": "move", "row": 0, "col": 2} plays a move.
+- {"type": "quit"} closes the connection.
+Messages sent by the server:
+- {"type": "board", "board": [[...]], "player": 1} sent when it is the
+  client's turn. The board uses the central representation of Game_system
+  (1 = Player 1, -1 = Player 2) and player is the client's player number.
+- {"type": "game_over", "result": 1, "board": [[...]], "scores": {...},
+   "latency": {...}} where result is 1, 2 or "DRAW" and latency contains the
+   statistics of the AI moves of the session.
+- {"type": "error", "message": "..."}
+
+Launch this script directly to start a server, or use run_test_client to
+play random moves against it.
+"""
+
+import asyncio
+import copy
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from game_system import Game_system
+from human_player import Human_player
+
+
+def create_random_ai():
+    from random_ai import Random_AI
+
+    return Random_AI()
+
+
+def create_testing_ai():
+    from testing_ai import Testing_AI
+
+    return Testing_AI()
+
+
+def create_q_learning_ai():
+    from q_learning import QLearningAI
+
+    player = QLearningAI()
+    player.learning = False
+    return player
+
+
+# Models loaded once and shared by all the sessions, by opponent name
+shared_models = {}
+
+
+def create_improved_q_learning_ai():
+    from improved_q_learning import Improved_q_learning
+
+    # The training data is only loaded for the first session. Each session
+    # then plays with a shallow copy of the model, which shares the training
+    # data but has its own history of moves. Since the model does not learn,
+    # the training data is never modified or saved
+    model = shared_models.get("improved_q_learning")
+    if model is None:
+        model = Improved_q_learning()
+        model.learning = False
+        model.explore = False
+        shared_models["improved_q_learning"] = model
+    player = copy.copy(model)
+    player.moves_history = []
+    return player
+
+
+def create_deep_q_learning_ai():
+    from deep_q_learning import DeepQLearningAI
+
+    # The network is shared by all the instances. The replay memory is never
+    # used since the model does not learn, so it is kept as small as possible
+    player = DeepQLearningAI(memory_capacity=1)
+    player.learning = False
+    return player
+
+
+# Largest number of rows or columns of a board, so that a client cannot make
+# the server allocate a huge board
+MAX_BOARD_DIMENSION = 100
+
+
+def is_integer(value):
+    """JSON booleans are loaded as bool, which is a subclass of int"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_game_settings(message):
+    """Returns the board dimensions and line length requested in a new_game
+    message. Raises ValueError with a message for the client if they are
+    invalid"""
+    board_dimensions = message.get("board_dimensions", [3, 3])
+    if (
+        not isinstance(board_dimensions, list)
+        or len(board_dimensions) != 2
+        or not all(is_integer(dimension) for dimension in board_dimensions)
+        or not all(
+            1 <= dimension <= MAX_BOARD_DIMENSION for dimension in board_dimensions
+        )
+    ):
+        raise ValueError(
+            "board_dimensions must contain two integers between 1 and "
+            f"{MAX_BOARD_DIMENSION}"
+        )
+
+    line_length = message.get("line_length", 3)
+    if not is_integer(line_length) or not 1 <= line_length <= max(board_dimensions):
+        raise ValueError(
+            "line_length must be an integer between 1 and the largest dimension "
+            "of the board"
+        )
+    return tuple(board_dimensions), line_length
+
+
+# Opponents available to the clients. The boolean tells whether the moves of
+# the AI are slow enough to be computed in the executor rather than in the
+# event loop. The models are imported only when a client asks for them.
+OPPONENTS = {
+    "random": (create_random_ai, False),
+    "testing": (create_testing_ai, False),
+    "q_learning": (create_q_learning_ai, False),
+    "improved_q_learning": (create_improved_q_learning_ai, False),
+    "deep_q_learning": (create_deep_q_learning_ai, True),
+}
+
+
+class Game_session:
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.game_system = None
+        self.opponent = None
+        self.run_ai_in_executor = False
+
+        # Statistics about the time taken by the AI moves. Only aggregates are
+        # kept so that the memory used by a session stays bounded.
+        self.moves_count = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def latency_stats(self):
+        """Returns the statistics of the AI moves played in this session"""
+        return {
+            "moves": self.moves_count,
+            "mean": self.total_latency / max(self.moves_count, 1),
+            "max": self.max_latency,
+        }
+
+    async def send(self, message):
+        self.writer.write(json.dumps(message).encode() + b"\n")
+        await self.writer.drain()
+
+    async def receive(self):
+        """Returns the next message of the client, or None if the client left
+        or stayed idle for too long"""
+        try:
+            line = await asyncio.wait_for(
+                self.reader.readline(), self.server.idle_timeout
+            )
+        except (asyncio.TimeoutError, ValueError, ConnectionError):
+            return None
+        if not line:
+            return None
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            message = None
+        if not isinstance(message, dict):
+            await self.send({"type": "error", "message": "Invalid JSON message"})
+            return {}
+        return message
+
+    async def run(self):
+        """Serves the client until it leaves"""
+        while True:
+            message = await self.receive()
+            if message is None or message.get("type") == "quit":
+                return
+            if message.get("type") != "new_game":
+                await self.send({"type": "error", "message": "No game in progress"})
+                continue
+            try:
+                if not await self.play_game(message):
+                    return
+            except ConnectionError:
+                raise
+            except Exception as error:
+                # The client is told that its game failed rather than being
+                # disconnected, and can start a new one
+                await self.send(
+                    {"type": "error", "message": f"The game failed: {error!r}"}
+                )
+
+    async def play_game(self, message):
+        """Plays a game against the AI requested by the client. Returns False
+        if the client left during the game"""
+        opponent = message.get("opponent", "random")
+        if opponent not in OPPONENTS:
+            await self.send(
+                {"type": "error", "message": f"Unknown opponent {opponent}"}
+            )
+            return True
+
+        try:
+            board_dimensions, line_length = parse_game_settings(message)
+        except ValueError as error:
+            await self.send({"type": "error", "message": str(error)})
+            return True
+        if self.game_system is None or self.opponent != opponent:
+            create_ai, self.run_ai_in_executor = OPPONENTS[opponent]
+            self.opponent = opponent
+            self.game_system = Game_system(Human_player(), create_ai())
+        self.game_system.line_length = line_length
+
+        game_system = self.game_system
+        game_system.start_game(board_dimensions)
+        while True:
+            if game_system.turn == 1:
+                if not await self.play_client_move():
+                    return False
+            else:
+                await self.play_ai_move()
+            game_system.turn = 3 - game_system.turn
+
+            result = game_system.check_for_endgame()
+            if result != "CONTINUE":
+                game_system.end_game(result)
+                await self.send(
+                    {
+                        "type": "game_over",
+                        "result": result,
+                        "board": game_system.current_board.tolist(),
+                        "scores": game_system.player_1_scores,
+                        "latency": self.latency_stats(),
+                    }
+                )
+                return True
+
+    async def play_client_move(self):
+        """Waits for a valid move from the client. Returns False if the client
+        left"""
+        board = self.game_system.current_board
+        await self.send({"type": "board", "board": board.tolist(), "player": 1})
+        while True:
+            message = await self.receive()
+            if message is None or message.get("type") == "quit":
+                return False
+            try:
+                row, col = int(message["row"]), int(message["col"])
+                valid = (
+                    0 <= row < board.shape[0]
+                    and 0 <= col < board.shape[1]
+                    and board[row, col] == 0
+                )
+            except (KeyError, TypeError, ValueError):
+                valid = False
+            if valid:
+                self.game_system.play_human_move((row, col), 1)
+                return True
+            await self.send({"type": "error", "message": "Invalid move"})
+
+    async def play_ai_move(self):
+        """Plays the move of the AI, in the executor if the AI is slow"""
+        starting_time = perf_counter()
+        if self.run_ai_in_executor:
+            await asyncio.get_running_loop().run_in_executor(
+                self.server.executor, self.game_system.play_ai_move, 2
+            )
+        else:
+            self.game_system.play_ai_move(2)
+        latency = perf_counter() - starting_time
+
+        self.moves_count += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+
+class Game_server:
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=8765,
+        max_sessions=10000,
+        idle_timeout=600,
+        executor_workers=4,
+    ):
+        self.host = host
+        self.port = port
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers)
+        self.sessions = set()
+        self.server = None
+
+    async def start(self):
+        """Starts listening. If port is 0, the port picked by the system is
+        stored in self.port"""
+        # The size of the messages is limited to keep the memory used by each
+        # connection small
+        self.server = await asyncio.start_server(
+            self.handle_client, self.host, self.port, limit=4096
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown(wait=False)
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Serving on {self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle_client(self, reader, writer):
+        session = Game_session(self, reader, writer)
+        try:
+            if len(self.sessions) >= self.max_sessions:
+                await session.send({"type": "error", "message": "Server is full"})
+                return
+            self.sessions.add(session)
+            await session.run()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+
+    def stats(self):
+        """Returns the number of sessions and the latency of the AI moves of
+        each session"""
+        return {
+            "sessions": len(self.sessions),
+            "latency": [session.latency_stats() for session in self.sessions],
+        }
+
+
+async def run_test_client(host, port, games_count=1, opponent="random"):
+    """Connects to a game server and plays games_count games with random
+    moves. Returns the list of the 'game_over' messages received"""
+    reader, writer = await asyncio.open_connection(host, port)
+    results = []
+
+    async def send(message):
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+
+    for i in range(games_count):
+        await send({"type": "new_game", "opponent": opponent})
+        while True:
+            message = json.loads(await reader.readline())
+            if message["type"] == "board":
+                empty_cells = [
+                    (row, col)
+                    for row, line in enumerate(message["board"])
+                    for col, value in enumerate(line)
+                    if value == 0
+                ]
+                row, col = random.choice(empty_cells)
+                await send({"type": "move", "row": row, "col": col})
+            elif message["type"] == "game_over":
+                results.append(message)
+                break
+            else:
+                raise RuntimeError(message["message"])
+
+    await send({"type": "quit"})
+    writer.close()
+    await writer.wait_closed()
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(Game_server().serve_forever())
@@ -2,13 +2,32 @@
 
 
 import random
+from time import perf_counter
+
 import numpy as np
 
 from interfaces import Game_system_interface
+from bitboard import Bitboard, generate_lines
+
+# The central board uses a signed representation:
+# 0 = no one played this space
+# 1 = Player 1 played here
+# -1 = Player 2 played here
+# PLAYER_SIGNS gives the value used for each player number.
+PLAYER_SIGNS = (0, 1, -1)
 
 
 class Game_system(Game_system_interface):
-    def __init__(self, player_1, player_2, graphics=0):
+    def __init__(
+        self,
+        player_1,
+        player_2,
+        graphics=0,
+        bitboard=False,
+        line_length=3,
+        recorder=None,
+        instrumentation=None,
+    ):
         if not graphics:
             self.no_display = True
         else:
@@ -24,10 +43,77 @@ class Game_system(Game_system_interface):
         self.current_board = []
         self.turn = 0
 
+        # The board is allocated once and reused from one game to the next.
+        # flipped_board holds the board as seen by Player 2, and board_views
+        # contains read-only views of the board for each player
+        self.board_buffer = None
+        self.flipped_board = None
+        self.board_views = None
+
+        # If bitboard is set to True, the rules are checked on a Bitboard
+        # object that is kept in sync with current_board, which is much faster
+        # than scanning the whole board after each move
+        self.bitboard = bitboard
+        self.engine = None
+
+        # Number of symbols a player needs to align to win the game
+        self.line_length = line_length
+        # The last move played and the number of empty spaces are kept up to
+        # date so that check_for_endgame only needs to look at the lines going
+        # through the last move
+        self.last_move = None
+        self.last_player = None
+        self.empty_cells = 0
+
+        # If a recorder is given (e.g. a Game_record_writer), each game is sent
+        # to its record_game method at the end of the game
+        self.recorder = recorder
+        self.starting_player = 0
+        self.moves_played = []
+
+        # If an instrumentation object is given (see instrumentation.py), its
+        # hooks are called before and after each move and at the end of each
+        # game to measure the time spent in each phase
+        self.instrumentation = instrumentation
+
     def play_a_game(self, board_dimensions=(3, 3)):
         """Start a new game"""
 
-        self.current_board = np.zeros(board_dimensions, dtype=np.int8)
+        self.start_game(board_dimensions)
+        instrumentation = self.instrumentation
+        while True:
+            # The condition below is triggered when the user closes the game window
+            if self.play_one_move() == "EXIT":
+                return False
+            if instrumentation is None:
+                result = self.check_for_endgame()
+            else:
+                starting_time = perf_counter()
+                result = self.check_for_endgame()
+                instrumentation.add_endgame_check_time(perf_counter() - starting_time)
+            if result != "CONTINUE":
+                self.end_game(result)
+                return True
+
+    def start_game(self, board_dimensions=(3, 3)):
+        """Resets the board and picks the player who starts. Used by play_a_game,
+        and by the game server which plays the moves itself"""
+
+        if self.board_buffer is None or self.board_buffer.shape != tuple(
+            board_dimensions
+        ):
+            self.use_board_buffer(np.zeros(board_dimensions, dtype=np.int8))
+        self.current_board = self.board_buffer
+        self.current_board.fill(0)
+        self.last_move = None
+        self.last_player = None
+        self.empty_cells = self.current_board.size
+        if self.bitboard:
+            if self.engine is None or self.engine.board_dimensions != tuple(
+                board_dimensions
+            ):
+                self.engine = Bitboard(board_dimensions, self.line_length)
+            self.engine.reset()
         if not self.no_display:
             self.graphics.update_players_data(
                 self.player_1.is_AI,
@@ -36,193 +122,277 @@ class Game_system(Game_system_interface):
                 self.player_2_scores,
             )
         self.turn = random.randint(1, 2)
-        running = True
-        while running:
-            # The condition below is triggered when the user closes the game window
-            if self.play_one_move() == "EXIT":
-                running = False
-                return False
-            result = self.check_for_endgame()
-            if result == "DRAW":  # i.e. if the game is a draw
-                running = False
-
-                self.player_1_scores["DRAWS"] += 1
-                self.player_2_scores["DRAWS"] += 1
-                if not self.no_display:
-                    self.graphics.update_players_data(
-                        self.player_1.is_AI,
-                        self.player_1_scores,
-                        self.player_2.is_AI,
-                        self.player_2_scores,
-                    )
-                self.player_1.notify_game_result(0.5)
-                self.player_2.notify_game_result(0.5)
-
-            elif result == 1:  # i.e. if Player 1 won
-                running = False
-
-                self.player_1_scores["WINS"] += 1
-                self.player_2_scores["LOSSES"] += 1
-                if not self.no_display:
-                    self.graphics.update_players_data(
-                        self.player_1.is_AI,
-                        self.player_1_scores,
-                        self.player_2.is_AI,
-                        self.player_2_scores,
-                    )
-                self.player_1.notify_game_result(1)
-                self.player_2.notify_game_result(0)
-
-            elif result == 2:  # i.e. if Player 2 won
-                running = False
-
-                self.player_1_scores["LOSSES"] += 1
-                self.player_2_scores["WINS"] += 1
-                if not self.no_display:
-                    self.graphics.update_players_data(
-                        self.player_1.is_AI,
-                        self.player_1_scores,
-                        self.player_2.is_AI,
-                        self.player_2_scores,
-                    )
-                self.player_1.notify_game_result(0)
-                self.player_2.notify_game_result(1)
-        return True
+        self.starting_player = self.turn
+        self.moves_played = []
+        if self.instrumentation is not None:
+            self.instrumentation.start_of_game()
+
+    def end_game(self, result):
+        """Updates the scores and notifies the players once the game is over.
+        result is the value returned by check_for_endgame"""
+        if self.recorder is not None:
+            self.recorder.record_game(
+                self.starting_player,
+                self.moves_played,
+                result,
+                self.current_board.shape,
+            )
+        if self.instrumentation is not None:
+            self.instrumentation.end_of_game(result)
+
+        if result == "DRAW":  # i.e. if the game is a draw
+            self.player_1_scores["DRAWS"] += 1
+            self.player_2_scores["DRAWS"] += 1
+            if not self.no_display:
+                self.graphics.update_players_data(
+                    self.player_1.is_AI,
+                    self.player_1_scores,
+                    self.player_2.is_AI,
+                    self.player_2_scores,
+                )
+            self.player_1.notify_game_result(0.5)
+            self.player_2.notify_game_result(0.5)
+
+        elif result == 1:  # i.e. if Player 1 won
+            self.player_1_scores["WINS"] += 1
+            self.player_2_scores["LOSSES"] += 1
+            if not self.no_display:
+                self.graphics.update_players_data(
+                    self.player_1.is_AI,
+                    self.player_1_scores,
+                    self.player_2.is_AI,
+                    self.player_2_scores,
+                )
+            self.player_1.notify_game_result(1)
+            self.player_2.notify_game_result(0)
+
+        elif result == 2:  # i.e. if Player 2 won
+            self.player_1_scores["LOSSES"] += 1
+            self.player_2_scores["WINS"] += 1
+            if not self.no_display:
+                self.graphics.update_players_data(
+                    self.player_1.is_AI,
+                    self.player_1_scores,
+                    self.player_2.is_AI,
+                    self.player_2_scores,
+                )
+            self.player_1.notify_game_result(0)
+            self.player_2.notify_game_result(1)
 
     def play_one_move(self):
         """This method is called until someone wins the game"""
         if self.turn == 1:
-            if self.player_1.is_AI:
-                # The board is converted so that the AI can understand it. see
-                # convert_board_for_player for more details
-                board = self.convert_board_for_player(1)
-                new_board = self.player_1.play(board)
-                # The board is then converted back to its central representation
-                self.current_board = self.convert_back_board_from_ai(new_board, 1)
-                if not self.no_display:
-                    # Telling the graphics to update the display based on the AI move
-                    if self.graphics.update_display(self.current_board) == "EXIT":
-                        return "EXIT"
+            player = self.player_1
+        else:
+            player = self.player_2
 
-            else:
-                if not self.no_display:
-                    move = self.graphics.wait_for_move(self.current_board)
-                if move == "EXIT":
-                    return "EXIT"
-                self.current_board[move[0], move[1]] = 1
-            self.turn = 2
-
-        elif self.turn == 2:
-            if self.player_2.is_AI:
-                # The board is converted so that the AI can understand it. see
-                # convert_board_for_player for more details
-                board = self.convert_board_for_player(2)
-                new_board = self.player_2.play(board)
-                # The board is then converted back to its central representation
-                self.current_board = self.convert_back_board_from_ai(new_board, 2)
-                if not self.no_display:
-                    # Telling the graphics to update the display based on the AI move
-                    if self.graphics.update_display(self.current_board) == "EXIT":
-                        return "EXIT"
+        if self.instrumentation is not None:
+            self.instrumentation.before_move(self.turn)
 
-            else:
-                if not self.no_display:
-                    move = self.graphics.wait_for_move(self.current_board)
-                if move == "EXIT":
+        if player.is_AI:
+            self.play_ai_move(self.turn)
+            if not self.no_display:
+                # Telling the graphics to update the display based on the AI move
+                starting_time = perf_counter()
+                display_result = self.graphics.update_display(self.current_board)
+                if self.instrumentation is not None:
+                    self.instrumentation.add_display_time(
+                        perf_counter() - starting_time
+                    )
+                if display_result == "EXIT":
                     return "EXIT"
-                self.current_board[move[0], move[1]] = 2
-            self.turn = 1
+
+        else:
+            if not self.no_display:
+                starting_time = perf_counter()
+                move = self.graphics.wait_for_move(self.current_board)
+                if self.instrumentation is not None:
+                    self.instrumentation.add_play_time(perf_counter() - starting_time)
+            if move == "EXIT":
+                return "EXIT"
+            self.play_human_move(move, self.turn)
+
+        if self.instrumentation is not None:
+            self.instrumentation.after_move(self.turn)
+        self.turn = 3 - self.turn
+
+    def play_ai_move(self, player_nbr):
+        """Asks the AI player player_nbr to play and applies its move"""
+        if player_nbr == 1:
+            player = self.player_1
+        else:
+            player = self.player_2
+
+        # The AI gets the board from its own perspective. see board_for_player
+        # for more details
+        board = self.board_for_player(player_nbr, player.needs_board_copy)
+        if self.instrumentation is None:
+            new_board = player.play(board)
+        else:
+            starting_time = perf_counter()
+            new_board = player.play(board)
+            self.instrumentation.add_play_time(perf_counter() - starting_time)
+        played_cell = self.find_played_cell(new_board, player_nbr)
+        if played_cell is not None:
+            self.register_move(played_cell, player_nbr)
+        else:
+            # The AI did not play exactly one move on an empty space, so the
+            # board it returned is taken as it is
+            self.load_board(self.convert_back_board_from_ai(new_board, player_nbr))
+
+    def play_human_move(self, move, player_nbr):
+        """Applies the move (row, column) chosen by the human player player_nbr"""
+        self.register_move(move[0] * self.current_board.shape[1] + move[1], player_nbr)
+
+    def register_move(self, cell, player_nbr):
+        """Plays the box at index 'cell' of the flattened board for player_nbr
+        and keeps track of it"""
+        cell = int(cell)
+        self.current_board.flat[cell] = PLAYER_SIGNS[player_nbr]
+        self.last_move = divmod(cell, self.current_board.shape[1])
+        self.last_player = player_nbr
+        self.empty_cells -= 1
+        self.moves_played.append(cell)
+        if self.bitboard:
+            self.engine.play(cell, player_nbr)
 
     def check_for_endgame(self):
-        """Checks if the game is over, i.e. if a player aligned 3 symbols"""
-        no_space_left = True
-        testing_x = testing_y = range(-1, 2)
-
-        for index, value in np.ndenumerate(self.current_board):
-            if value == 0:
-                no_space_left = False
-
-            elif (value == 1) or (value == 2):
-                for i in testing_x:
-                    for j in testing_y:
-                        if i == 0 and j == 0:
-                            continue
-                        try:
-                            if (
-                                self.current_board[index[0] + i, index[1] + j] == value
-                            ) and (
-                                self.current_board[index[0] + 2 * i, index[1] + 2 * j]
-                                == value
-                            ):
-                                if (
-                                    index[0] + i >= 0
-                                    and index[0] + 2 * i >= 0
-                                    and index[1] + j >= 0
-                                    and index[1] + 2 * j >= 0
-                                ):
-                                    return value
-                        except IndexError:
-                            continue
-
-        if no_space_left:
+        """Checks if the game is over, i.e. if a player aligned line_length
+        symbols. Only the lines going through the last move are checked, so
+        the cost of this method does not depend on the size of the board"""
+        if self.current_board is not self.board_buffer:
+            self.adopt_board()
+        if self.last_move is None:
+            return self.scan_for_endgame()
+        if self.bitboard:
+            return self.engine.check_for_endgame()
+
+        row, col = self.last_move
+        for d_row, d_col in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            aligned = (
+                1
+                + self.count_aligned(row, col, d_row, d_col)
+                + self.count_aligned(row, col, -d_row, -d_col)
+            )
+            if aligned >= self.line_length:
+                return self.last_player
+
+        if self.empty_cells == 0:
             return "DRAW"
         return "CONTINUE"
 
-    def convert_board_for_player(self, player_nbr):
-        """The board's state is stored as an array of numbers ranging from
-        0 to 2:
-        0 = no one played this space
-        1 = Player 1 played here
-        2 = Player 2 played here
-        Meanwhile, the AI needs to get arrays with -1, 0 and 1 where -1 is a
-        space played by the opponent, 0 a space that wasn't played, and 1 a space
-        already played by the AI. This method takes care of converting the array
-        from one format to the other"""
+    def count_aligned(self, row, col, d_row, d_col):
+        """Counts the symbols of the last player aligned with the box (row, col)
+        in the direction (d_row, d_col), without counting the box itself"""
+        rows, cols = self.current_board.shape
+        count = 0
+        for step in range(1, self.line_length):
+            next_row = row + d_row * step
+            next_col = col + d_col * step
+            if not (0 <= next_row < rows and 0 <= next_col < cols):
+                break
+            if (
+                self.current_board[next_row, next_col]
+                != PLAYER_SIGNS[self.last_player]
+            ):
+                break
+            count += 1
+        return count
 
-        if player_nbr == 1:
-            board_for_player_1 = self.current_board.copy()
-            for index, value in np.ndenumerate(self.current_board):
-                if value == 1:
-                    board_for_player_1[index] = 1
-                elif value == 2:
-                    board_for_player_1[index] = -1
-                else:
-                    board_for_player_1[index] = 0
-            return board_for_player_1
-
-        elif player_nbr == 2:
-            board_for_player_2 = self.current_board.copy()
-            for index, value in np.ndenumerate(self.current_board):
-                if value == 1:
-                    board_for_player_2[index] = -1
-                elif value == 2:
-                    board_for_player_2[index] = 1
-                else:
-                    board_for_player_2[index] = 0
-            return board_for_player_2
+    def scan_for_endgame(self):
+        """Checks the whole board for an alignment. Used when the last move
+        played is unknown, e.g. when current_board was set directly"""
+        flat_board = self.current_board.flatten()
+        for line in generate_lines(self.current_board.shape, self.line_length):
+            value = flat_board[line[0]]
+            if value != 0 and all(flat_board[cell] == value for cell in line):
+                return PLAYER_SIGNS.index(value)
+
+        if not (flat_board == 0).any():
+            return "DRAW"
+        return "CONTINUE"
+
+    def use_board_buffer(self, board):
+        """Sets the array used to store the board during the games and
+        prepares the views given to the players"""
+        self.board_buffer = board
+        self.flipped_board = np.zeros_like(board)
+        self.board_views = [None, board.view(), self.flipped_board.view()]
+        self.board_views[1].flags.writeable = False
+        self.board_views[2].flags.writeable = False
+
+    def adopt_board(self):
+        """Called when current_board was assigned directly instead of being
+        played move by move: the new array becomes the board buffer, and since
+        the last move is unknown, the next endgame check scans the whole
+        board"""
+        self.use_board_buffer(self.current_board)
+        self.last_move = None
+        self.last_player = None
+        self.empty_cells = int(np.count_nonzero(self.current_board == 0))
+        if self.bitboard:
+            if self.engine is None or self.engine.board_dimensions != tuple(
+                self.current_board.shape
+            ):
+                self.engine = Bitboard(self.current_board.shape, self.line_length)
+            self.engine.load_board(self.current_board)
+
+    def board_for_player(self, player_nbr, copy=False):
+        """Returns the board as seen by player_nbr, i.e. an array of -1, 0 and 1
+        where -1 is a space played by the opponent, 0 a space that wasn't
+        played, and 1 a space already played by the player.
+
+        Since the central board is signed, this is the board itself for
+        Player 1 and its opposite for Player 2. Unless copy is True, the array
+        returned is a read-only view that is reused for every move, so players
+        that modify the board they are given must set needs_board_copy."""
+
+        if copy:
+            return self.convert_board_for_player(player_nbr)
+
+        # The board may have been replaced since the views were created
+        if self.current_board is not self.board_buffer:
+            self.adopt_board()
+        if player_nbr == 2:
+            np.negative(self.current_board, out=self.flipped_board)
+        return self.board_views[player_nbr]
+
+    def find_played_cell(self, new_board, player_nbr):
+        """Returns the index on the flattened board of the box played by an AI,
+        given the new board it returned. Returns None if the new board is not
+        the current board plus one move on an empty space"""
+        sign = PLAYER_SIGNS[player_nbr]
+        flat_board = self.current_board.ravel()
+        changed_cells = np.flatnonzero(new_board.ravel() * sign != flat_board)
+        if changed_cells.size != 1 or flat_board[changed_cells[0]] != 0:
+            return None
+        if new_board.flat[changed_cells[0]] != 1:
+            return None
+        return changed_cells[0]
+
+    def load_board(self, board):
+        """Replaces the current board with board (central representation).
+        Since the last move is unknown, the next endgame check scans the
+        whole board. The boxes that changed are added to the moves played, so
+        that the game can still be recorded"""
+        changed_cells = np.flatnonzero(
+            np.asarray(board).ravel() != self.current_board.ravel()
+        )
+        self.moves_played.extend(int(cell) for cell in changed_cells)
+        self.current_board[...] = board
+        self.last_move = None
+        self.last_player = None
+        self.empty_cells = int(np.count_nonzero(self.current_board == 0))
+        if self.bitboard:
+            self.engine.load_board(self.current_board)
+
+    def convert_board_for_player(self, player_nbr):
+        """Returns a copy of the board from the perspective of player_nbr
+        (see board_for_player)"""
+        return self.current_board * np.int8(PLAYER_SIGNS[player_nbr])
 
     def convert_back_board_from_ai(self, board, player_nbr):
         """This method does the opposit of convert_board_for_player. It converts
-        back the array from a matrix of -1, 0 and 1 to a matrix of 0, 1 and 2"""
-
-        if player_nbr == 1:
-            actual_board = board.copy()
-            for index, value in np.ndenumerate(board):
-                if value == 1:
-                    actual_board[index] = 1
-                elif value == -1:
-                    actual_board[index] = 2
-                else:
-                    actual_board[index] = 0
-            return actual_board
-
-        elif player_nbr == 2:
-            actual_board = board.copy()
-            for index, value in np.ndenumerate(board):
-                if value == 1:
-                    actual_board[index] = 2
-                elif value == -1:
-                    actual_board[index] = 1
-                else:
-                    actual_board[index] = 0
-            return actual_board
+        back the array from the perspective of player_nbr to the central
+        representation"""
+        return (board * PLAYER_SIGNS[player_nbr]).astype(np.int8)
@@ -119,7 +119,7 @@ class Graphics(Graphics_interface):
                 pygame.draw.circle(
                     self.screen, (0, 0, 255), pos, 0.45 * space_height, 5
                 )
-            elif value == 2:
+            elif value == -1:
                 x = round(self.window_size[0] * 0.15 + space_width * index[1])
                 y = round(self.window_size[1] * 0.15 + space_height * index[0])
                 pos = (round(x + space_width / 2), round(y + space_height / 2))
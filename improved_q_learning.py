@@ -5,16 +5,25 @@ with a better one in this project.
 Inherits from Player_interface, defines the behaviour of the AI player.
 """
 
+import os
 import random
 import json
+import zipfile
 
 import numpy as np
 
 from interfaces import Player_interface
+from persistence import atomic_write, load_npz, Checkpoint_policy
 
 
 class Improved_q_learning(Player_interface):
-    def __init__(self):
+    def __init__(
+        self,
+        training_file="training.json",
+        compact_every_games=100,
+        memory_map=False,
+        shard_file=None,
+    ):
         self.is_AI = True
 
         # If always_explore is set to True, the AI will always try new moves, even when it
@@ -25,6 +34,9 @@ class Improved_q_learning(Player_interface):
         self.always_explore = False
         self.explore = True
         self.exploration_rate = 0.5
+        # If learning is set to False, the results of the games are neither
+        # added to the training data nor saved, e.g. for evaluation games
+        self.learning = True
 
         if self.always_explore:
             print(
@@ -33,6 +45,30 @@ class Improved_q_learning(Player_interface):
         if self.exploration_rate == 0 and not self.always_explore:
             print("WARNING: AI's exploration rate is set to 0 (never trying new moves)")
 
+        # The training data is saved in training_file. After each game, only
+        # the states that changed are appended to a log file next to it, and
+        # the log is folded back into training_file (compaction) every
+        # compact_every_games games. See save_training_changes()
+        # If training_file ends with ".npz", the training data is saved in a
+        # binary format instead of JSON, which loads much faster, and which can
+        # be memory-mapped instead of being read if memory_map is True. See
+        # write_training_file() for more details
+        # If shard_file is given, training_file is only read and the results
+        # of the games played by this instance are saved in shard_file
+        # instead, so that several processes can train at the same time. The
+        # shards are then merged into training_file by merge_training_shards()
+        self.training_file = training_file
+        self.memory_map = memory_map
+        self.shard_file = shard_file
+        self.saved_file = shard_file or training_file
+        self.log_file = self.saved_file + ".log"
+        self.compaction_policy = Checkpoint_policy(compact_every_games, None)
+        self.changed_states = set() # Indices of the states changed since the last save
+        self.log_is_valid = False # Whether the log applies to the saved file
+        # Results of the games played since the last merge, in shard mode
+        self.shard_data = []
+        self.shard_indices = {}
+
         self.training_data = self.load_training_data()
         self.moves_history = []
     
@@ -63,16 +99,14 @@ class Improved_q_learning(Player_interface):
         # The candidate moves are divided into two lists depending on whether or not
         # they are already known
         for c in candidate_moves:
-            move_is_known = False
-            for s in self.training_data:
-                if np.array_equal(c, s["array"]):
-                    # The value of a state represents how likely it is to make the
-                    # AI win
-                    known_moves.append({"array": s["array"], "value": s["value"]})
-                    move_is_known = True
-                    break
+            state_index = self.state_indices.get(self.state_key(c))
+            if state_index is not None:
+                s = self.training_data[state_index]
+                # The value of a state represents how likely it is to make the
+                # AI win
+                known_moves.append({"array": s["array"], "value": s["value"]})
             # If the move is unknown, there is no known value
-            if not move_is_known:
+            else:
                 unknown_moves.append(c)
 
         if not known_moves:
@@ -118,6 +152,9 @@ class Improved_q_learning(Player_interface):
         return chosen_move
 
     def notify_game_result(self, result):
+        if not self.learning:
+            self.moves_history.clear()
+            return
         self.update_training_scores(result)
 
     def update_training_scores(self, game_result):
@@ -137,9 +174,42 @@ class Improved_q_learning(Player_interface):
             self.update_training_data(self.moves_history[state_index], state_value)
 
         self.moves_history.clear()
-        self.write_training_data()
+        self.save_training_changes()
         return
 
+    @property
+    def training_data(self):
+        """List of the known states, as dictionaries containing the state
+        ("array"), its value and its number of occurences"""
+        return self.training_states
+
+    @training_data.setter
+    def training_data(self, training_data):
+        # The position of each state in the list is indexed by the key of the
+        # state, so that a state can be found without going through the whole
+        # list. States must thus be added through update_training_data, or
+        # by assigning a new list.
+        self.training_states = training_data
+        self.changed_states.clear()
+        self.state_indices = self.build_state_indices(training_data)
+
+    def build_state_indices(self, training_data):
+        """Returns a dictionary giving the position of each state in the list,
+        from the key of the state"""
+        if isinstance(training_data, Mapped_training_data):
+            return Mapped_state_indices(training_data)
+        state_indices = {}
+        for state_index, state in enumerate(training_data):
+            # Like a linear search, the first occurence of a state is used
+            state_indices.setdefault(self.state_key(state["array"]), state_index)
+        return state_indices
+
+    @staticmethod
+    def state_key(state):
+        """Returns a hashable key that identifies the given board"""
+        state = np.asarray(state, dtype=np.int8)
+        return (state.shape, state.tobytes())
+
     def should_explore(self, state_value):
         """Decides whether or not the AI should explore vs playing already known
         moves. The better the best known move is, the less likely is to try new moves.
@@ -155,84 +225,380 @@ class Improved_q_learning(Player_interface):
         return False
 
     def load_training_data(self):
-        """The training data is stored in a JSON file"""
-        training_data = []
-
+        """The training data is stored in a JSON or .npz file, followed by the
+        changes appended to the log file since this file was written. In shard
+        mode, the training data also includes the results saved in the shard"""
+        saved_data = self.load_training_file(self.saved_file)
+        # If the file was deleted, the log is deleted at the next save
+        self.log_is_valid = saved_data is not None
+        if saved_data is None:
+            saved_data = []
+        if self.shard_file is None:
+            return saved_data
+
+        self.shard_data = saved_data
+        self.shard_indices = self.build_state_indices(saved_data)
+        training_data = self.load_training_file(self.training_file)
+        return merge_training_data([training_data or [], saved_data])
+
+    def load_training_file(self, path):
+        """Reads the training data from a file and from its log. Returns None if
+        the file does not exist or cannot be read"""
         try:
-            with open("training.json", "r+", newline="") as json_file:
-                try:
-                    json_data = json.load(json_file)
-
-                except json.decoder.JSONDecodeError:
-                    return []
-                
+            training_data = self.read_training_file(path)
+        except (ValueError, KeyError, zipfile.BadZipFile):
+            # Includes the JSON decoding errors
+            return None
         except FileNotFoundError:
-            return []
+            return None
 
-        for state in json_data:
-            converted_state = {}
-            flat_array = np.array(state["array"])
-            converted_state["array"] = np.reshape(flat_array, state["dim"])
-            converted_state["value"] = state["value"]
-            converted_state["occurences"] = state["occurences"]
-            training_data.append(converted_state)
+        # Replaying the log: each line contains the new data of a state
+        state_indices = self.build_state_indices(training_data)
+        try:
+            with open(path + ".log", "r") as log_file:
+                for line in log_file:
+                    try:
+                        state = self.convert_json_state(json.loads(line))
+                    except json.decoder.JSONDecodeError:
+                        # A line that was being written when the program stopped
+                        break
+                    state_key = self.state_key(state["array"])
+                    if state_key in state_indices:
+                        training_data[state_indices[state_key]] = state
+                    else:
+                        state_indices[state_key] = len(training_data)
+                        training_data.append(state)
+        except FileNotFoundError:
+            pass
 
         return training_data
 
+    def read_training_file(self, path):
+        """Reads the training data from a JSON or .npz file"""
+        if path.endswith(".npz"):
+            training_arrays = load_npz(path, "r" if self.memory_map else None)
+            shape = tuple(training_arrays["shape"].tolist())
+            if self.memory_map:
+                # The states are read from the mapped arrays when needed
+                return Mapped_training_data(
+                    training_arrays["states"],
+                    shape,
+                    training_arrays["values"],
+                    training_arrays["occurences"],
+                )
+            return [
+                {
+                    "array": state.reshape(shape),
+                    "value": value,
+                    "occurences": occurences,
+                }
+                for state, value, occurences in zip(
+                    training_arrays["states"],
+                    training_arrays["values"].tolist(),
+                    training_arrays["occurences"].tolist(),
+                )
+            ]
+
+        with open(path, "r+", newline="") as json_file:
+            json_data = json.load(json_file)
+        return [self.convert_json_state(state) for state in json_data]
+
+    def convert_json_state(self, state):
+        """Converts a state read from the JSON file"""
+        converted_state = {}
+        flat_array = np.array(state["array"])
+        converted_state["array"] = np.reshape(flat_array, state["dim"])
+        converted_state["value"] = state["value"]
+        converted_state["occurences"] = state["occurences"]
+        return converted_state
+
+    def convert_state_to_json(self, state):
+        """Converts a state to be written in the JSON file"""
+        json_entry = {}
+
+        flat_array = state["array"].flatten()
+        # json_entry["array"] = np.array2string(flat_array)
+        json_entry["array"] = flat_array.tolist()
+        json_entry["dim"] = state["array"].shape
+        json_entry["value"] = state["value"]
+        json_entry["occurences"] = state["occurences"]
+        return json_entry
+
     def update_training_data(self, state, value):
         """This method updates the current training data based on the result of
         the last game"""
 
-        new_occurences_number = 0
-        new_state_value = 0
+        state_index = self.add_result(
+            self.training_data, self.state_indices, state, value
+        )
+        if self.shard_file is not None:
+            state_index = self.add_result(
+                self.shard_data, self.shard_indices, state, value
+            )
+        self.changed_states.add(state_index)
+
+    def add_result(self, training_data, state_indices, state, value):
+        """Adds the value obtained for a state to the mean value of this state
+        in training_data, and returns the position of the state in the list"""
 
-        for state_index in range(len(self.training_data)):
-            if np.array_equal(self.training_data[state_index]["array"], state):
-                new_occurences_number = (
-                    self.training_data[state_index]["occurences"] + 1
-                )
-                new_state_value = (
-                    self.training_data[state_index]["value"]
-                    * self.training_data[state_index]["occurences"]
-                    + value
-                ) / (self.training_data[state_index]["occurences"] + 1)
-                existing_data_index = state_index
-                break
-
-        if new_occurences_number == 0:
-            new_occurences_number = 1
-            new_state_value = value
-            self.training_data.append(
+        state_key = self.state_key(state)
+        existing_data_index = state_indices.get(state_key)
+
+        if existing_data_index is None:
+            state_indices[state_key] = len(training_data)
+            training_data.append(
                 {
                     "array": state,
-                    "value": new_state_value,
-                    "occurences": new_occurences_number,
+                    "value": value,
+                    "occurences": 1,
                 }
             )
-            return
+            return len(training_data) - 1
 
-        self.training_data[existing_data_index] = {
+        existing_data = training_data[existing_data_index]
+        new_occurences_number = existing_data["occurences"] + 1
+        new_state_value = (
+            existing_data["value"] * existing_data["occurences"] + value
+        ) / (existing_data["occurences"] + 1)
+
+        training_data[existing_data_index] = {
             "array": state,
             "value": new_state_value,
             "occurences": new_occurences_number,
         }
+        return existing_data_index
+
+    def saved_training_data(self):
+        """Returns the training data saved by this instance: the results of its
+        games in shard mode, all the training data otherwise"""
+        if self.shard_file is not None:
+            return self.shard_data
+        return self.training_data
+
+    def save_training_changes(self):
+        """
+        Appends the states changed since the last save to the log file, so
+        that the cost of a save only depends on the number of moves played.
+        The whole training data is written instead if the log is due for
+        compaction, or if it does not apply to the current training file.
+        """
+        if self.compaction_policy.game_played() or not self.log_is_valid:
+            self.write_training_data()
+            return
 
-    def write_training_data(self):
-        """Writes the updated training data in the JSON file"""
-
-        with open("training.json", "w", newline="") as json_file:
-            json_global_list = []
-
-            for state in self.training_data:
-                json_entry = {}
+        saved_data = self.saved_training_data()
+        log_lines = [
+            json.dumps(self.convert_state_to_json(saved_data[state_index])) + "\n"
+            for state_index in sorted(self.changed_states)
+        ]
+        # A line is only written once complete, and an incomplete last line is
+        # ignored by load_training_data
+        with open(self.log_file, "a") as log_file:
+            log_file.write("".join(log_lines))
+        self.changed_states.clear()
 
-                flat_array = state["array"].flatten()
-                # json_entry["array"] = np.array2string(flat_array)
-                json_entry["array"] = flat_array.tolist()
-                json_entry["dim"] = state["array"].shape
-                json_entry["value"] = state["value"]
-                json_entry["occurences"] = state["occurences"]
+    def write_training_data(self):
+        """Writes the updated training data in the training file (or in the
+        shard file), which replaces the log"""
+
+        self.write_training_file(self.saved_file, self.saved_training_data())
+
+        if os.path.exists(self.log_file):
+            os.remove(self.log_file)
+        self.log_is_valid = True
+        self.changed_states.clear()
+        self.compaction_policy.checkpoint_done()
+
+    def write_training_file(self, path, training_data=None):
+        """
+        Writes the training data (by default the whole training data of the
+        model) in a JSON file, or in a .npz file if path ends with ".npz".
+        The .npz file contains the states as a matrix of
+        int8 with one flattened state per row, the shape of the states, and
+        the values and the number of occurences of the states as columns. It
+        is not compressed so that its arrays can be memory-mapped.
+
+        Can also be used to convert the training data from one format to the
+        other.
+        """
+        if training_data is None:
+            training_data = self.training_data
+
+        if not path.endswith(".npz"):
+            json_global_list = [
+                self.convert_state_to_json(state) for state in training_data
+            ]
+            atomic_write(
+                path,
+                lambda json_file: json.dump(json_global_list, json_file, indent=4),
+                mode="w",
+            )
+            return
 
-                json_global_list.append(json_entry)
+        shapes = {np.shape(state["array"]) for state in training_data}
+        if len(shapes) > 1:
+            raise ValueError("All the states must have the same shape in .npz files")
+        shape = shapes.pop() if shapes else (3, 3)
+        states = np.zeros((len(training_data), int(np.prod(shape))), np.int8)
+        for state_index, state in enumerate(training_data):
+            states[state_index] = np.ravel(state["array"])
+        values = np.array([state["value"] for state in training_data], float)
+        occurences = np.array(
+            [state["occurences"] for state in training_data], np.int64
+        )
+        atomic_write(
+            path,
+            lambda npz_file: np.savez(
+                npz_file,
+                states=states,
+                shape=np.array(shape),
+                values=values,
+                occurences=occurences,
+            ),
+        )
+
+
+class Mapped_training_data:
+    def __init__(self, states, shape, values, occurences):
+        """
+        Training data read from a memory-mapped .npz file (see
+        Improved_q_learning.write_training_file). It can be used like the
+        list of dictionaries used otherwise, but the dictionary of a state is
+        only built when the state is accessed, so that loading the file does
+        not depend on the number of states. The states changed or added
+        afterwards are kept in memory, on top of the mapped arrays.
+        """
+        self.states = states
+        self.shape = shape
+        self.values = values
+        self.occurences = occurences
+        self.updated_states = {} # Mapped states replaced, by position
+        self.added_states = []
+
+    def __len__(self):
+        return len(self.states) + len(self.added_states)
+
+    def __getitem__(self, state_index):
+        state_index = self.check_index(state_index)
+        if state_index >= len(self.states):
+            return self.added_states[state_index - len(self.states)]
+        if state_index in self.updated_states:
+            return self.updated_states[state_index]
+        return {
+            "array": np.array(self.states[state_index]).reshape(self.shape),
+            "value": float(self.values[state_index]),
+            "occurences": int(self.occurences[state_index]),
+        }
 
-            json.dump(json_global_list, json_file, indent=4)
+    def __setitem__(self, state_index, state):
+        state_index = self.check_index(state_index)
+        if state_index >= len(self.states):
+            self.added_states[state_index - len(self.states)] = state
+        else:
+            self.updated_states[state_index] = state
+
+    def __iter__(self):
+        for state_index in range(len(self)):
+            yield self[state_index]
+
+    def append(self, state):
+        self.added_states.append(state)
+
+    def check_index(self, state_index):
+        """Returns the position of a state, given like a list index"""
+        if state_index < 0:
+            state_index += len(self)
+        if not 0 <= state_index < len(self):
+            raise IndexError("training data index out of range")
+        return state_index
+
+
+class Mapped_state_indices:
+    def __init__(self, training_data):
+        """
+        Gives the position of each state of a Mapped_training_data from the
+        key of the state, like the dictionary returned by
+        Improved_q_learning.build_state_indices. The mapped states are
+        sorted once by numpy and found with a binary search, so no Python
+        object is created for them. The keys of the states added afterwards
+        are kept in a dictionary.
+        """
+        self.shape = training_data.shape
+        # Each flattened state is seen as a single value made of its bytes
+        self.state_dtype = np.dtype((np.void, training_data.states.shape[1]))
+        mapped_keys = np.ascontiguousarray(training_data.states).view(
+            self.state_dtype
+        )
+        # The sort is stable so that the first occurence of a state is found
+        self.order = np.argsort(mapped_keys.ravel(), kind="stable")
+        self.sorted_keys = mapped_keys.ravel()[self.order]
+        self.added_indices = {}
+
+    def get(self, state_key, default=None):
+        if state_key in self.added_indices:
+            return self.added_indices[state_key]
+        shape, state_bytes = state_key
+        if shape != self.shape or len(state_bytes) != self.state_dtype.itemsize:
+            return default
+        key = np.frombuffer(state_bytes, dtype=self.state_dtype)[0]
+        position = np.searchsorted(self.sorted_keys, key)
+        if position < len(self.sorted_keys) and self.sorted_keys[position] == key:
+            return int(self.order[position])
+        return default
+
+    def __contains__(self, state_key):
+        return self.get(state_key) is not None
+
+    def __getitem__(self, state_key):
+        state_index = self.get(state_key)
+        if state_index is None:
+            raise KeyError(state_key)
+        return state_index
+
+    def __setitem__(self, state_key, state_index):
+        self.added_indices[state_key] = state_index
+
+
+def merge_training_data(training_data_lists):
+    """
+    Merges several lists of training data into a new one. The number of
+    occurences of each state are summed, and its values are averaged,
+    weighted by their number of occurences, so that the value of a state is
+    the mean of all the results it was given.
+    """
+    merged_data = []
+    state_indices = {}
+    for training_data in training_data_lists:
+        for state in training_data:
+            state_key = Improved_q_learning.state_key(state["array"])
+            if state_key not in state_indices:
+                state_indices[state_key] = len(merged_data)
+                merged_data.append(dict(state))
+                continue
+            merged_state = merged_data[state_indices[state_key]]
+            occurences = merged_state["occurences"] + state["occurences"]
+            merged_state["value"] = (
+                merged_state["value"] * merged_state["occurences"]
+                + state["value"] * state["occurences"]
+            ) / occurences
+            merged_state["occurences"] = occurences
+    return merged_data
+
+
+def merge_training_shards(training_file, shard_files):
+    """
+    Adds the results saved in the shard files to the training data saved in
+    training_file, then deletes the shards. Must not be called while models
+    are still saving results in the shards.
+    """
+    model = Improved_q_learning(training_file)
+    shards = [model.load_training_file(shard_file) for shard_file in shard_files]
+    model.training_data = merge_training_data(
+        [model.training_data] + [shard for shard in shards if shard is not None]
+    )
+    model.write_training_data()
+
+    for shard_file in shard_files:
+        for path in (shard_file, shard_file + ".log"):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,148 @@
+"""
+Optional instrumentation of Game_system, used to find out where the time goes
+during self-play: in the players' play() method, in the board conversions,
+in the endgame checks or in the display.
+
+Pass a Game_instrumentation object to Game_system to enable it. When no
+instrumentation is given, Game_system only pays for a few 'is None' checks
+per move.
+"""
+
+import bisect
+import csv
+from time import perf_counter
+
+
+class Latency_histogram:
+    def __init__(self, min_latency=1e-7, max_latency=100.0, buckets_per_decade=20):
+        """
+        Histogram with logarithmic buckets, from min_latency to max_latency
+        seconds. The percentiles are approximated by the upper bound of the
+        bucket they fall in, i.e. with a precision of about 12% with 20
+        buckets per decade.
+        """
+        self.edges = []
+        edge = min_latency
+        while edge < max_latency:
+            self.edges.append(edge)
+            edge *= 10 ** (1 / buckets_per_decade)
+        self.edges.append(max_latency)
+        # The last bucket contains every latency above max_latency
+        self.counts = [0] * (len(self.edges) + 1)
+        self.total_count = 0
+        self.total_time = 0.0
+
+    def record(self, latency):
+        self.counts[bisect.bisect_left(self.edges, latency)] += 1
+        self.total_count += 1
+        self.total_time += latency
+
+    def percentile(self, percent):
+        """Returns the approximate latency under which percent% of the values fall"""
+        if self.total_count == 0:
+            return 0.0
+        threshold = self.total_count * percent / 100
+        cumulated_count = 0
+        for index, count in enumerate(self.counts):
+            cumulated_count += count
+            if cumulated_count >= threshold:
+                return self.edges[min(index, len(self.edges) - 1)]
+        return self.edges[-1]
+
+    def summary(self):
+        return {
+            "count": self.total_count,
+            "mean": self.total_time / max(self.total_count, 1),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class Game_instrumentation:
+    # Phases of the game whose cumulated time is measured:
+    # - play: time spent in the players' play() method (or waiting for a human)
+    # - conversion: time spent preparing the board for the players and
+    #   applying their moves
+    # - endgame_check: time spent in check_for_endgame
+    # - display: time spent updating the display after the moves of the AIs
+    PHASES = ("play", "conversion", "endgame_check", "display")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.move_latencies = {1: Latency_histogram(), 2: Latency_histogram()}
+        self.game_durations = Latency_histogram()
+        self.phase_times = {phase: 0.0 for phase in Game_instrumentation.PHASES}
+        self.games_count = 0
+        self.results = {1: 0, 2: 0, "DRAW": 0}
+        self.game_starting_time = None
+        self.move_starting_time = None
+        self.play_time = 0.0
+        self.display_time = 0.0
+
+    def start_of_game(self):
+        self.game_starting_time = perf_counter()
+
+    def before_move(self, player_nbr):
+        self.play_time = 0.0
+        self.display_time = 0.0
+        self.move_starting_time = perf_counter()
+
+    def add_play_time(self, duration):
+        """Called by the game system with the time spent in the player's play()"""
+        self.play_time += duration
+
+    def add_display_time(self, duration):
+        """Called by the game system with the time spent updating the display"""
+        self.display_time += duration
+
+    def after_move(self, player_nbr):
+        move_duration = perf_counter() - self.move_starting_time
+        self.move_latencies[player_nbr].record(move_duration)
+        self.phase_times["play"] += self.play_time
+        self.phase_times["display"] += self.display_time
+        self.phase_times["conversion"] += (
+            move_duration - self.play_time - self.display_time
+        )
+
+    def add_endgame_check_time(self, duration):
+        self.phase_times["endgame_check"] += duration
+
+    def end_of_game(self, result):
+        if self.game_starting_time is not None:
+            self.game_durations.record(perf_counter() - self.game_starting_time)
+        self.games_count += 1
+        if result in self.results:
+            self.results[result] += 1
+
+    def snapshot(self):
+        """Returns all the measures as a dictionary (durations in seconds)"""
+        return {
+            "games": self.games_count,
+            "results": dict(self.results),
+            "move_latency": {
+                player_nbr: histogram.summary()
+                for player_nbr, histogram in self.move_latencies.items()
+            },
+            "game_duration": self.game_durations.summary(),
+            "phase_times": dict(self.phase_times),
+        }
+
+    def to_csv(self, path):
+        """Writes the snapshot in a CSV file with one measure per line"""
+        snapshot = self.snapshot()
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["measure", "key", "value"])
+            writer.writerow(["games", "", snapshot["games"]])
+            for result, count in snapshot["results"].items():
+                writer.writerow(["results", result, count])
+            for player_nbr, summary in snapshot["move_latency"].items():
+                for key, value in summary.items():
+                    writer.writerow([f"move_latency_player_{player_nbr}", key, value])
+            for key, value in snapshot["game_duration"].items():
+                writer.writerow(["game_duration", key, value])
+            for phase, value in snapshot["phase_times"].items():
+                writer.writerow(["phase_times", phase, value])
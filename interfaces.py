@@ -5,6 +5,12 @@ from abc import ABC, abstractmethod
 
 
 class Player_interface(ABC):
+    # The game system gives the players a read-only view of the board, which
+    # is reused from one move to the next. Players that modify the board they
+    # are given instead of returning a new array must set this to True to
+    # receive a copy instead.
+    needs_board_copy = False
+
     @abstractmethod
     def play(self, current_state):
         """Asks a player object to play a move given the current state of the
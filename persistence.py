@@ -0,0 +1,157 @@
+"""
+Helpers used by the models to save their training data.
+"""
+
+import os
+import stat
+import struct
+import tempfile
+import zipfile
+from time import monotonic
+
+import numpy as np
+
+# Permissions of the new files, read once since os.umask can only be read by
+# changing it
+_umask = os.umask(0)
+os.umask(_umask)
+NEW_FILE_MODE = 0o666 & ~_umask
+
+
+def file_mode(path):
+    """
+    Returns the permissions to give to a file written at path: those of the
+    existing file, or the default permissions of new files. The temporary
+    files created by tempfile.mkstemp are only readable by their owner, and
+    the rename would keep these permissions.
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return NEW_FILE_MODE
+
+
+def atomic_write(path, write_function, mode="wb"):
+    """
+    Writes a file through write_function(file) without ever leaving a
+    truncated file behind: the data is written to a temporary file in the same
+    folder, which then replaces the file at path in a single rename.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, temporary_path = tempfile.mkstemp(
+        dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(file_descriptor, mode) as temporary_file:
+            write_function(temporary_file)
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+        os.chmod(temporary_path, file_mode(path))
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def atomic_create(path, write_function, mode="wb"):
+    """
+    Like atomic_write, but never replaces an existing file. Returns False if a
+    file already exists at path (e.g. if another process created it first).
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, temporary_path = tempfile.mkstemp(
+        dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(file_descriptor, mode) as temporary_file:
+            write_function(temporary_file)
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+        os.chmod(temporary_path, NEW_FILE_MODE)
+        # Unlike a rename, creating a hard link fails if the file exists
+        os.link(temporary_path, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(temporary_path)
+
+
+class Checkpoint_policy:
+    def __init__(self, every_games=100, every_seconds=60.0):
+        """
+        Decides when the training data should be saved: every 'every_games'
+        games or every 'every_seconds' seconds, whichever comes first. Either
+        criterion can be disabled by setting it to None.
+        """
+        self.every_games = every_games
+        self.every_seconds = every_seconds
+        self.checkpoint_done()
+
+    def game_played(self):
+        """Counts a game and returns True if a checkpoint is due"""
+        self.games_since_checkpoint += 1
+        if (
+            self.every_games is not None
+            and self.games_since_checkpoint >= self.every_games
+        ):
+            return True
+        if (
+            self.every_seconds is not None
+            and monotonic() - self.last_checkpoint_time >= self.every_seconds
+        ):
+            return True
+        return False
+
+    def checkpoint_done(self):
+        self.games_since_checkpoint = 0
+        self.last_checkpoint_time = monotonic()
+
+
+def load_npz(path, mmap_mode=None):
+    """
+    Loads all the arrays of a .npz file written by np.savez, as a dictionary.
+
+    np.load cannot memory-map the arrays of a .npz file. If mmap_mode is
+    given (see np.memmap), the arrays stored without compression are
+    memory-mapped directly from the .npz file instead of being read, using
+    their offset in the zip archive.
+    """
+    if mmap_mode is None:
+        with np.load(path) as npz_file:
+            return dict(npz_file)
+
+    arrays = {}
+    with zipfile.ZipFile(path) as zip_file, open(path, "rb") as raw_file:
+        for member in zip_file.infolist():
+            name = member.filename[: -len(".npy")]
+            if member.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = np.load(zip_file.open(member))
+                continue
+            # The data of a member follows its 30-byte local header, which
+            # ends with the lengths of the file name and of the extra field
+            raw_file.seek(member.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", raw_file.read(4))
+            raw_file.seek(name_length + extra_length, os.SEEK_CUR)
+
+            # The data is a .npy file, whose header gives the array layout
+            version = np.lib.format.read_magic(raw_file)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(raw_file)
+            else:
+                header = np.lib.format.read_array_header_2_0(raw_file)
+            shape, fortran_order, dtype = header
+            if dtype.hasobject or 0 in shape:
+                arrays[name] = np.load(zip_file.open(member), allow_pickle=False)
+                continue
+            arrays[name] = np.memmap(
+                path,
+                dtype=dtype,
+                mode=mmap_mode,
+                offset=raw_file.tell(),
+                shape=shape,
+                order="F" if fortran_order else "C",
+            )
+    return arrays
@@ -1,22 +1,60 @@
 """
 Implementation of the Q-Learning model for tic-tac-toe.
 """
+import os
+import atexit
 import pickle
-import itertools
 import random
+import uuid
 
 import numpy as np
 
 from interfaces import Player_interface
+from persistence import atomic_write, atomic_create, Checkpoint_policy
+from board_encoding import (
+    STATES_COUNT,
+    POWERS_OF_3,
+    encode_board,
+    encode_boards,
+    decode_board,
+    decode_boards,
+    canonical_codes,
+    successor_graph,
+    winners,
+)
+
+# Initial values of the q-table, computed once by
+# QLearningAI.generate_initial_q_table. The version must be changed whenever
+# the initial values change.
+INITIAL_Q_TABLE_VERSION = 1
+INITIAL_Q_TABLE_PATH = (
+    f"training_data/q_learning_initial_v{INITIAL_Q_TABLE_VERSION}.npz"
+)
 
 class QLearningAI(Player_interface):
 
-    q_table = [] # The Q-table contains the values associated to each
-    # state. It is a 2D list of shape [[np.array...], [value...]].
+    q_table = None # The Q-table contains the values associated to each
+    # state. It is a numpy array of STATES_COUNT floats indexed by the code of
+    # each state (see board_encoding.py), where states that are not in the
+    # table have a NaN value.
     # The q-table is a static attribute as it needs to be shared
     # between all instances of QLearningAI models.
-
-    def __init__(self, alpha=0.005, gamma=0.5, epsilon=0.5):
+    q_table_symmetry = None # Whether the shared q-table is symmetry-reduced
+    q_table_shared_path = None # Path of the memory-mapped q-table, if any
+    dirty_codes = set() # Indices of the entries updated since the last checkpoint
+    generation = None # Identifier of the last full snapshot of the q-table
+    exit_flush_registered = False
+
+    def __init__(
+        self,
+        alpha=0.005,
+        gamma=0.5,
+        epsilon=0.5,
+        symmetry=False,
+        checkpoint_every_games=100,
+        checkpoint_every_seconds=60.0,
+        shared_table_path=None,
+    ):
         self.is_AI = True
         self.history = [] # List of all successive moves in the current game
         # Used at the end of each game to update the q-table
@@ -32,19 +70,59 @@ class QLearningAI(Player_interface):
         #self.training_frequency = 20 # Defines how often the model should update its
         # Q-table (every n games)
 
-
-        if QLearningAI.q_table == []:
-            # Try to load from a pkl file if list is empty
+        # If symmetry is True, all the boards that are rotations or reflections
+        # of each other share a single entry of the q-table, stored under their
+        # canonical code (see board_encoding.py). The moves are still chosen
+        # and returned in the actual orientation of the board, only the
+        # values are looked up through the canonical codes.
+        self.symmetry = symmetry
+        if symmetry:
+            self.training_data_path = "training_data/q_learning_symmetric.pkl"
+        else:
+            self.training_data_path = "training_data/q_learning.pkl"
+        # If shared_table_path is given, the q-table is a memory-mapped file
+        # that several processes can open and train at the same time. See
+        # open_shared_q_table for more details
+        self.shared_table_path = shared_table_path
+        if QLearningAI.q_table is not None and (
+            QLearningAI.q_table_symmetry != symmetry
+            or QLearningAI.q_table_shared_path != shared_table_path
+        ):
+            raise ValueError(
+                "All QLearningAI instances must use the same 'symmetry' and "
+                "'shared_table_path' settings"
+            )
+        QLearningAI.q_table_symmetry = symmetry
+        QLearningAI.q_table_shared_path = shared_table_path
+        self.journal_path = self.training_data_path + ".journal"
+
+        # Instead of saving the whole q-table after each game, the table is
+        # saved every checkpoint_every_games games or every
+        # checkpoint_every_seconds seconds, and when the program exits.
+        # See checkpoint() for more details
+        self.checkpoint_policy = Checkpoint_policy(
+            checkpoint_every_games, checkpoint_every_seconds
+        )
+        if not QLearningAI.exit_flush_registered:
+            atexit.register(self.checkpoint)
+            QLearningAI.exit_flush_registered = True
+
+        if QLearningAI.q_table is None and shared_table_path:
+            QLearningAI.q_table = self.open_shared_q_table()
+        elif QLearningAI.q_table is None:
+            # Try to load from a pkl file if the table is not loaded yet
             try:
-                with open("training_data/q_learning.pkl", "rb") as training_data:
-                    QLearningAI.q_table = pickle.load(training_data)
+                QLearningAI.q_table = self.load_training_data()
             except FileNotFoundError:
                 QLearningAI.q_table = self.generate_initial_q_table()
                 self.save_training_data()
     
     def __str__(self):
 
-        return f"q_learning_alpha{self.alpha}_gamma{self.gamma}_epsilon{self.epsilon}"
+        name = f"q_learning_alpha{self.alpha}_gamma{self.gamma}_epsilon{self.epsilon}"
+        if self.symmetry:
+            name += "_symmetric"
+        return name
 
 
     def play(self, current_state: np.array) -> np.array:
@@ -83,7 +161,8 @@ class QLearningAI(Player_interface):
         self.games_played += 1
         if self.learning:
             self.update_q_table(result)
-            self.save_training_data()
+            if self.checkpoint_policy.game_played():
+                self.checkpoint()
         self.history = []
     
     def update_q_table(self, reward):
@@ -96,18 +175,24 @@ class QLearningAI(Player_interface):
         """
 
         for state_index in reversed(range(len(self.history)-1)):
-            for index in range(len(QLearningAI.q_table[0])):
-                if np.array_equal(self.history[state_index], QLearningAI.q_table[0][index]):
-                    current_state = QLearningAI.q_table[0][index]
-                    current_value = QLearningAI.q_table[1][index]
-                    
-                    new_value = (
-                        (1-self.alpha) * current_value +
-                        self.alpha * (reward + 
-                                      self.gamma * 
-                                      self.find_best_next_state(current_state)[1]))
-                    
-                    QLearningAI.q_table[1][index] = new_value
+            state_code = encode_board(self.history[state_index])
+            table_code = self.table_index(state_code)
+            current_value = QLearningAI.q_table[table_code]
+            if np.isnan(current_value):
+                continue
+
+            # The best state at t+1 is the best of all the states that can
+            # follow this one after the opponent plays and we play back
+            followup_values = self.followup_values(state_code)
+            new_value = (
+                (1-self.alpha) * current_value +
+                self.alpha * (reward + 
+                              self.gamma * 
+                              np.nanmax(followup_values)))
+            
+            QLearningAI.q_table[table_code] = new_value
+            if not self.shared_table_path:
+                QLearningAI.dirty_codes.add(int(table_code))
 
     
     def find_best_next_state(self, current_state):
@@ -119,20 +204,30 @@ class QLearningAI(Player_interface):
         plays.
         """
 
-        # Find all possible states after the opponent plays, and finds the
-        # best possible move we could play after that
-        possible_future_states = [[], []]
-        for x in range(len(current_state)):
-            for y in range(len(current_state[x])):
-                if current_state[x, y] == 0:
-                    possible_new_state = current_state.copy()
-                    possible_new_state[x, y] = -1
-                    best_future_move = self.get_best_move(possible_new_state)
-                    possible_future_states[0].append(best_future_move[0])
-                    possible_future_states[1].append(best_future_move[1])
+        # All possible states after the opponent plays and we play back are
+        # grouped by the opponent's move, so the first best state is the one
+        # that would be found by looking at each move of the opponent in turn
+        current_code = encode_board(current_state)
+        followup_values = self.followup_values(current_code)
+        best_index = np.nanargmax(followup_values)
+        graph = successor_graph()
+        best_state_code = graph["followup_codes"][
+            graph["followup_ptr"][current_code] + best_index
+        ]
 
-        best_move_index = possible_future_states[1].index(max(possible_future_states[1]))
-        return (possible_future_states[0][best_move_index], possible_future_states[1][best_move_index])              
+        return (decode_board(best_state_code), followup_values[best_index])
+
+    def followup_values(self, state_code):
+        """
+        Returns the values of all the states that can follow the state with
+        the given code after the opponent plays and we play back, read from
+        the precomputed successor graph (see board_encoding.py).
+        """
+        graph = successor_graph()
+        followup_codes = graph["followup_codes"][
+            graph["followup_ptr"][state_code]:graph["followup_ptr"][state_code + 1]
+        ]
+        return QLearningAI.q_table[self.table_index(followup_codes)]
 
 
     
@@ -143,19 +238,16 @@ class QLearningAI(Player_interface):
         # Appending arrays corresponding to every possible move in a list called
         # candidate_moves
         candidate_moves = []
-        values = []
-        for index, value in np.ndenumerate(current_board):
-            if value == 0:
-                possible_move = current_board.copy()
-                possible_move[index] = 1
-                candidate_moves.append(possible_move)
+        empty_cells = np.flatnonzero(current_board.ravel() == 0)
+        for cell in empty_cells:
+            possible_move = current_board.copy()
+            possible_move.flat[cell] = 1
+            candidate_moves.append(possible_move)
         
-        # Retrieving the values associated with each possible move
-        for move in candidate_moves:
-            for index in range(len(QLearningAI.q_table[0])):
-                if np.array_equal(move, QLearningAI.q_table[0][index]):
-                    values.append(QLearningAI.q_table[1][index])
-                    break
+        # Retrieving the values associated with each possible move: playing
+        # in a box adds the power of 3 of this box to the code of the board
+        candidate_codes = encode_board(current_board) + POWERS_OF_3[empty_cells]
+        values = QLearningAI.q_table[self.table_index(candidate_codes)].tolist()
         
         return [candidate_moves, values]
 
@@ -166,9 +258,15 @@ class QLearningAI(Player_interface):
         board.
         """
         possible_moves = self.get_all_possible_moves(current_board)
-        best_move_index = possible_moves[1].index(max(possible_moves[1]))
+        best_move_index = int(np.nanargmax(possible_moves[1]))
         return (possible_moves[0][best_move_index], possible_moves[1][best_move_index])
     
+    def table_index(self, codes):
+        """Returns the indices in the q-table of the states with the given codes"""
+        if self.symmetry:
+            return canonical_codes(codes)
+        return codes
+
     def get_random_move(self, current_board):
         """
         Returns a random move among all moves that are available.
@@ -223,46 +321,176 @@ class QLearningAI(Player_interface):
     
     def generate_initial_q_table(self):
         """
-        Generates a Q-table where each state is assigned a random value.
+        Generates a Q-table where each state is assigned a predefined value.
+
+        Called when no q-table is available. The values are computed once and
+        saved in the versioned file INITIAL_Q_TABLE_PATH, which the next
+        calls simply load.
+        """
+        try:
+            with np.load(INITIAL_Q_TABLE_PATH) as initial_table:
+                q_table = initial_table["q_table"]
+        except (OSError, ValueError, KeyError):
+            # No saved table yet, or a file that cannot be read
+            q_table = self.build_initial_q_table()
+            atomic_write(
+                INITIAL_Q_TABLE_PATH, lambda f: np.savez(f, q_table=q_table)
+            )
+
+        if self.symmetry:
+            # Only one state per symmetry class is kept
+            all_codes = np.arange(STATES_COUNT)
+            q_table[canonical_codes(all_codes) != all_codes] = np.nan
+        return q_table
+
+    def build_initial_q_table(self):
+        """
+        Computes the initial values of all the states at once: 0 if it is a
+        loss, 1 if it is a victory, 0.5 if it is a draw or if the game is
+        still going. The illegal states are left out of the table (NaN).
+        """
+        boards = decode_boards(np.arange(STATES_COUNT)).reshape(STATES_COUNT, -1)
+
+        # Excluding all boards with an impossible number of moves by either player
+        legal_boards = np.isin(boards.sum(axis=1, dtype=np.int64), (0, 1))
 
-        Called when no q-table is available. Note that the terminal states
-        (winning or losing positions) are set to 0 or -1.
+        # Like check_for_endgame, if both players have an alignment, the
+        # winner is the player whose line starts on the first box of the board
+        board_winners = winners(np.arange(STATES_COUNT))
+
+        q_table = np.full(STATES_COUNT, np.nan)
+        q_table[legal_boards] = 0.5
+        q_table[legal_boards & (board_winners == -1)] = 0
+        q_table[legal_boards & (board_winners == 1)] = 1
+        return q_table
+
+    def checkpoint(self):
         """
+        Saves the entries of the q-table updated since the last checkpoint.
 
-        # Generating all combinations of 3x3 boards first
-        boards = [np.reshape(np.array(i), (3, 3)) for i in itertools.product([-1, 0, 1], repeat = 3*3)]
-
-        # Filtering all the combinations by removing the illegal ones
-        valid_states = []
-        values = []
-        for board in boards:
-            # excluding all boards with an impossible number of moves by either player
-            if np.sum(board) in (0, 1):
-                valid_states.append(board)
-
-                # if the board depicts a terminal state, we give it a predefined value:
-                # 0 if it is a loss, 1 if it is a victory, 0.5 if it is a draw.
-                # any other state is given a random value between 0 and 1.
-                board_status = self.check_for_endgame(board)
-                if board_status == -1:
-                    values.append(0)
-                elif board_status == 0:
-                    values.append(0.5)
-                elif board_status == 1:
-                    values.append(1)
-                else:
-                    #values.append(random.random())
-                    values.append(0.5)
-
-        return [valid_states, values]
+        When only a few entries changed, they are appended to a journal file
+        next to the pickle file instead of rewriting the whole table. The
+        journal is folded back into the pickle file once it gets too big.
+        """
+        self.checkpoint_policy.checkpoint_done()
+        if self.shared_table_path and QLearningAI.q_table is not None:
+            # The memory-mapped table is its own storage
+            QLearningAI.q_table.flush()
+            return
+        if not QLearningAI.dirty_codes or QLearningAI.q_table is None:
+            return
+
+        journal_size = 0
+        if os.path.exists(self.journal_path):
+            journal_size = os.path.getsize(self.journal_path)
+        if QLearningAI.generation is None or journal_size > 1 << 20:
+            self.save_training_data()
+            return
+
+        codes = np.array(sorted(QLearningAI.dirty_codes), dtype=np.int32)
+        with open(self.journal_path, "ab") as journal:
+            pickle.dump(
+                {
+                    "generation": QLearningAI.generation,
+                    "codes": codes,
+                    "values": QLearningAI.q_table[codes],
+                },
+                journal,
+            )
+            journal.flush()
+            os.fsync(journal.fileno())
+        QLearningAI.dirty_codes.clear()
 
     def save_training_data(self):
         """
         Saves the Q table in a pickle file.
-        """
-        with open("training_data/q_learning.pkl", "wb") as training_data:
-            pickle.dump(QLearningAI.q_table, training_data)
 
+        Only the states present in the table are saved, as a dictionary
+        containing their codes and their values. The file is replaced
+        atomically, so a crash never leaves a truncated file.
 
+        When the q-table is memory-mapped, it is only flushed to its file.
+        """
+        if self.shared_table_path:
+            QLearningAI.q_table.flush()
+            return
+
+        codes = np.flatnonzero(~np.isnan(QLearningAI.q_table))
+        generation = uuid.uuid4().hex
+
+        def write_q_table(training_data):
+            pickle.dump(
+                {
+                    "version": 2,
+                    "generation": generation,
+                    "codes": codes.astype(np.int32),
+                    "values": QLearningAI.q_table[codes],
+                },
+                training_data,
+            )
+
+        atomic_write(self.training_data_path, write_q_table)
+        QLearningAI.generation = generation
+        QLearningAI.dirty_codes.clear()
+        # The journal is only valid for the previous snapshot
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def open_shared_q_table(self):
+        """
+        Opens the q-table stored in the .npy file at shared_table_path as a
+        memory-mapped array, creating the file from the pickle file or from
+        the initial q-table if it does not exist yet.
+
+        Every process that opens the file maps the same memory, so there is
+        no copy of the table and the updates made by a process are
+        immediately seen by the others. The updates follow a lock-free,
+        Hogwild-style discipline: each entry is a single aligned float64
+        that is written in one store, so a value is never corrupted, but two
+        processes updating the same entry at the same time may lose one of
+        the two updates. Since a game only updates a handful of entries among
+        thousands, this is rare and does not prevent the training from
+        converging.
+        """
+        if not os.path.exists(self.shared_table_path):
+            try:
+                q_table = self.load_training_data()
+            except FileNotFoundError:
+                q_table = self.generate_initial_q_table()
+            # If several processes start at the same time, only the first
+            # one creates the file and the others open it
+            atomic_create(self.shared_table_path, lambda f: np.save(f, q_table))
+        return np.load(self.shared_table_path, mmap_mode="r+")
 
-    
\ No newline at end of file
+    def load_training_data(self):
+        """
+        Loads the Q table from the pickle file, then applies the updates saved
+        in the journal since this file was written.
+
+        Files saved by the previous versions of the model, which contain a list
+        [[np.array...], [value...]], are converted to the current format.
+        """
+        with open(self.training_data_path, "rb") as training_data:
+            saved_table = pickle.load(training_data)
+
+        q_table = np.full(STATES_COUNT, np.nan)
+        if isinstance(saved_table, dict):
+            q_table[saved_table["codes"]] = saved_table["values"]
+            QLearningAI.generation = saved_table.get("generation")
+        else:
+            states, values = saved_table
+            q_table[encode_boards(np.array(states))] = values
+            QLearningAI.generation = None
+
+        if QLearningAI.generation is not None and os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb") as journal:
+                while True:
+                    try:
+                        updates = pickle.load(journal)
+                    except (EOFError, ValueError, pickle.UnpicklingError):
+                        # The end of the journal, or an entry that was being
+                        # written when the program stopped
+                        break
+                    if updates["generation"] == QLearningAI.generation:
+                        q_table[updates["codes"]] = updates["values"]
+        return q_table
@@ -10,6 +10,8 @@ class Random_AI(Player_interface):
 
     def __init__(self):
         self.is_AI = True
+        # play() modifies the board it is given
+        self.needs_board_copy = True
 
     def play(self, current_state: np.array) -> np.array:
         """
@@ -29,6 +31,22 @@ class Random_AI(Player_interface):
         current_state[empty_boxes[0][ind], empty_boxes[1][ind]] = 1
         return current_state
 
+    def play_batch(self, current_states: np.array) -> np.array:
+        """
+        Plays a random move on each board of current_states, an array of
+        shape (n, rows, cols) using the same values as play().
+
+        Returns the new states of the boards.
+        """
+        flat_states = current_states.reshape(current_states.shape[0], -1)
+        # Each empty box gets a random score, the box with the highest
+        # score is played
+        scores = np.random.random(flat_states.shape)
+        scores[flat_states != 0] = -1
+        moves = np.argmax(scores, axis=1)
+        flat_states[np.arange(flat_states.shape[0]), moves] = 1
+        return flat_states.reshape(current_states.shape)
+
 
     def notify_game_result(self, result) -> None:
         return
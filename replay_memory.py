@@ -0,0 +1,91 @@
+"""
+Replay memory used by DeepQLearningAI to store the moves it played and to
+sample the minibatches it trains on.
+"""
+
+import numpy as np
+
+
+class Replay_memory:
+    def __init__(self, capacity=10000, state_size=9, priority_exponent=0.6):
+        """
+        Stores up to 'capacity' experiences (state, action, next state,
+        reward) in preallocated arrays. Once the memory is full, each new
+        experience replaces the oldest one.
+
+        Each experience also has a priority, used by sample() when the
+        sampling is prioritized: an experience is sampled with a probability
+        proportional to its priority raised to priority_exponent (0 gives a
+        uniform sampling). New experiences get the highest priority seen so
+        far, so that they are sampled at least once.
+        """
+        self.capacity = capacity
+        self.priority_exponent = priority_exponent
+
+        # The boards only contain -1, 0 and 1
+        self.states = np.zeros((capacity, state_size), dtype=np.int8)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.int8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.priorities = np.zeros(capacity, dtype=np.float64)
+        self.max_priority = 1.0
+
+        self.next_index = 0 # Where the next experience is written
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, next_state, reward):
+        index = self.next_index
+        self.states[index] = np.ravel(state)
+        self.actions[index] = action
+        self.next_states[index] = np.ravel(next_state)
+        self.rewards[index] = reward
+        self.priorities[index] = self.max_priority
+
+        self.next_index = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size, prioritized=False, correction_exponent=0.4):
+        """
+        Samples batch_size experiences, with replacement, uniformly or by
+        priority.
+
+        Returns the indices of the experiences (to update their priorities),
+        their states, actions, next states and rewards, and their importance
+        sampling weights. The weights compensate for the bias of the
+        prioritized sampling (fully if correction_exponent is 1), and are all
+        1 for a uniform sampling.
+        """
+        if self.size == 0:
+            raise ValueError("Cannot sample from an empty replay memory")
+
+        weights = np.ones(batch_size, dtype=np.float32)
+        if prioritized:
+            probabilities = self.priorities[: self.size] ** self.priority_exponent
+            probabilities /= probabilities.sum()
+            indices = np.random.choice(self.size, batch_size, p=probabilities)
+            weights = (self.size * probabilities[indices]) ** -correction_exponent
+            weights = (weights / weights.max()).astype(np.float32)
+        else:
+            indices = np.random.randint(0, self.size, batch_size)
+
+        return (
+            indices,
+            self.states[indices],
+            self.actions[indices],
+            self.next_states[indices],
+            self.rewards[indices],
+            weights,
+        )
+
+    def update_priorities(self, indices, errors, epsilon=1e-3):
+        """
+        Sets the priorities of the experiences at the given indices from the
+        errors of the network on them. epsilon keeps every experience likely
+        to be sampled again.
+        """
+        priorities = np.abs(errors) + epsilon
+        self.priorities[indices] = priorities
+        self.max_priority = max(self.max_priority, float(priorities.max()))
@@ -0,0 +1,192 @@
+"""
+Exact solver for 3x3 tic-tac-toe, used to seed the tabular models with the
+values they would learn after a perfect training.
+
+The value of a state is the result of the game for the player who just
+played, if both players play perfectly from there: 1 for a win, 0.5 for a
+draw and 0 for a loss, which is the scale of the results given to the models
+by Game_system. The values are computed backwards (retrograde analysis),
+starting from the full boards: a state is only solved once the states with
+fewer empty boxes are, so each state is evaluated once, whatever the number
+of move orders leading to it.
+
+Running this file writes the solved values in the files loaded by
+QLearningAI and Improved_q_learning.
+"""
+
+import json
+import os
+import pickle
+import uuid
+from time import perf_counter
+
+import numpy as np
+
+from persistence import atomic_write
+from board_encoding import (
+    CELLS_COUNT,
+    STATES_COUNT,
+    POWERS_OF_3,
+    decode_boards,
+    canonical_codes,
+    successor_graph,
+    winners,
+)
+
+
+def legal_states():
+    """
+    Returns a mask of the codes of the states that can be seen by a player
+    after its move, i.e. with as many or one more boxes checked by the player
+    than by the opponent, and the number of empty boxes of each state.
+    """
+    boards = decode_boards(np.arange(STATES_COUNT)).reshape(-1, CELLS_COUNT)
+    legal = np.isin(boards.sum(axis=1, dtype=np.int64), (0, 1))
+    return legal, (boards == 0).sum(axis=1)
+
+
+def solve():
+    """
+    Returns the value of every legal state after a player's move, as an
+    array indexed by code (see board_encoding.py). The illegal states are
+    NaN.
+    """
+    legal, empty_counts = legal_states()
+    board_winners = winners(np.arange(STATES_COUNT))
+    graph = successor_graph()
+
+    # Result of each state for the player who just played: 1, 0 or -1. The
+    # array doubles as the transposition table of the solver
+    results = np.full(STATES_COUNT, np.nan)
+    for empty_count in range(CELLS_COUNT + 1):
+        states = np.flatnonzero(legal & (empty_counts == empty_count))
+        terminal = board_winners[states] != 0
+        results[states[terminal]] = board_winners[states[terminal]]
+        states = states[~terminal]
+        if empty_count == 0:
+            # Draws
+            results[states] = 0
+            continue
+
+        # The opponent picks the reply that is the worst for the player, and
+        # the player then picks its best follow-up. The successors of each
+        # state are grouped by reply, with one follow-up per remaining box
+        replies = graph["reply_codes"][
+            graph["reply_ptr"][states][:, np.newaxis] + np.arange(empty_count)
+        ]
+        if empty_count > 1:
+            followups_count = empty_count * (empty_count - 1)
+            followups = graph["followup_codes"][
+                graph["followup_ptr"][states][:, np.newaxis]
+                + np.arange(followups_count)
+            ].reshape(len(states), empty_count, empty_count - 1)
+            reply_results = results[followups].max(axis=2)
+        else:
+            # The reply fills the board
+            reply_results = np.zeros(replies.shape)
+        # The opponent may win with its reply
+        reply_winners = board_winners[replies]
+        reply_results = np.where(reply_winners != 0, reply_winners, reply_results)
+        results[states] = reply_results.min(axis=1)
+
+    return (results + 1) / 2
+
+
+def reachable_states():
+    """
+    Returns the codes of the states that a player can see after its move in
+    an actual game, whichever player started.
+    """
+    legal, empty_counts = legal_states()
+    board_winners = winners(np.arange(STATES_COUNT))
+    graph = successor_graph()
+
+    reachable = np.zeros(STATES_COUNT, dtype=bool)
+    # The first move of the player, when it starts or after the first move
+    # of the opponent
+    reachable[POWERS_OF_3] = True
+    opponent_boxes, boxes = np.nonzero(~np.eye(CELLS_COUNT, dtype=bool))
+    reachable[2 * POWERS_OF_3[opponent_boxes] + POWERS_OF_3[boxes]] = True
+
+    # Each move of the player leads to states with two less empty boxes
+    for empty_count in range(CELLS_COUNT - 1, 1, -1):
+        states = np.flatnonzero(
+            reachable
+            & legal
+            & (empty_counts == empty_count)
+            & (board_winners == 0)
+        )
+        replies = graph["reply_codes"][
+            graph["reply_ptr"][states][:, np.newaxis] + np.arange(empty_count)
+        ]
+        followups = graph["followup_codes"][
+            graph["followup_ptr"][states][:, np.newaxis]
+            + np.arange(empty_count * (empty_count - 1))
+        ].reshape(len(states), empty_count, empty_count - 1)
+        # The game is over if the opponent wins with its reply
+        followups = followups[board_winners[replies] == 0]
+        reachable[followups.ravel()] = True
+
+    return np.flatnonzero(reachable)
+
+
+def write_q_table(path="training_data/q_learning.pkl", symmetry=False):
+    """
+    Writes the solved values of all the legal states in the pickle format
+    of QLearningAI. If symmetry is True, only the canonical states are kept,
+    as expected by QLearningAI(symmetry=True).
+    """
+    values = solve()
+    codes = np.flatnonzero(~np.isnan(values))
+    if symmetry:
+        codes = codes[canonical_codes(codes) == codes]
+
+    # Same layout as QLearningAI.save_training_data
+    def write_values(training_data):
+        pickle.dump(
+            {
+                "version": 2,
+                "generation": uuid.uuid4().hex,
+                "codes": codes.astype(np.int32),
+                "values": values[codes],
+            },
+            training_data,
+        )
+
+    atomic_write(path, write_values)
+    # The journal of the previous q-table does not apply to the new one
+    if os.path.exists(path + ".journal"):
+        os.remove(path + ".journal")
+
+
+def write_training_json(path="training.json", occurences=1):
+    """
+    Writes the solved values of the reachable states in the JSON format of
+    Improved_q_learning. Each state is given 'occurences' occurences, i.e.
+    the weight of the solved value when the model keeps learning.
+    """
+    values = solve()
+    codes = reachable_states()
+    boards = decode_boards(codes)
+    training_data = [
+        {
+            "array": board.ravel().tolist(),
+            "dim": list(board.shape),
+            "value": float(value),
+            "occurences": occurences,
+        }
+        for board, value in zip(boards, values[codes])
+    ]
+    atomic_write(path, lambda f: json.dump(training_data, f, indent=4), mode="w")
+    # The log of the previous training data does not apply to the new one
+    if os.path.exists(path + ".log"):
+        os.remove(path + ".log")
+
+
+if __name__ == "__main__":
+    starting_time = perf_counter()
+    write_q_table()
+    write_q_table("training_data/q_learning_symmetric.pkl", symmetry=True)
+    write_training_json()
+    solving_time = perf_counter() - starting_time
+    print(f"Solved and saved the training data in {solving_time:.2f}s")
@@ -0,0 +1,24 @@
+"""
+Fixtures shared by the unit tests.
+"""
+import pytest
+
+from q_learning import QLearningAI
+
+
+@pytest.fixture
+def q_learning_state():
+    """
+    Resets the q-table shared by the QLearningAI instances before and after
+    the test, even if the test fails, so that it does not leak into the
+    other tests.
+    """
+
+    def reset():
+        QLearningAI.q_table = None
+        QLearningAI.q_table_shared_path = None
+        QLearningAI.dirty_codes.clear()
+
+    reset()
+    yield
+    reset()
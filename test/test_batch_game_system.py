@@ -0,0 +1,68 @@
+"""
+Contains the unit tests for the batch game system, which plays many games
+at the same time.
+"""
+import pytest
+import numpy as np
+
+from batch_game_system import Batch_game_system, CONTINUE, PLAYER_1_WON, PLAYER_2_WON, DRAW
+from random_ai import Random_AI
+
+
+@pytest.fixture
+def batch_game_system():
+    """
+    Returns a batch game system with two random AIs.
+    """
+    return Batch_game_system(Random_AI(), Random_AI(), batch_size=64)
+
+
+def test_play_games(batch_game_system):
+    """
+    Makes sure that exactly the number of games requested is played.
+    """
+    batch_game_system.play_games(1000)
+
+    player_1_scores = batch_game_system.player_1_scores
+    player_2_scores = batch_game_system.player_2_scores
+    assert sum(player_1_scores.values()) == 1000
+    assert player_1_scores["WINS"] == player_2_scores["LOSSES"]
+    assert player_1_scores["LOSSES"] == player_2_scores["WINS"]
+    assert player_1_scores["DRAWS"] == player_2_scores["DRAWS"]
+
+
+def test_check_for_endgame(batch_game_system):
+    """
+    Tests the 'check_for_endgame' method on a batch of boards.
+    """
+    boards = np.array([[[1, 1, 1],
+                        [-1, -1, 0],
+                        [0, 0, 0]],
+                       [[1, 1, -1],
+                        [0, -1, 0],
+                        [-1, 0, 1]],
+                       [[1, -1, 1],
+                        [1, -1, -1],
+                        [-1, 1, 1]],
+                       [[1, -1, 0],
+                        [0, 0, 0],
+                        [0, 0, 0]]], dtype=np.int8)
+
+    batch_game_system.set_board_dimensions((3, 3))
+    results = batch_game_system.check_for_endgame(boards)
+
+    assert results.tolist() == [PLAYER_1_WON, PLAYER_2_WON, DRAW, CONTINUE]
+
+
+def test_play_batch():
+    """
+    Tests the 'play_batch' method of the random AI.
+    """
+    boards = np.zeros((10, 3, 3), dtype=np.int8)
+    boards[:, 1, 1] = -1
+
+    new_boards = Random_AI().play_batch(boards.copy())
+
+    # Checking that the AI played once and only once on each board
+    assert (np.count_nonzero(new_boards == 1, axis=(1, 2)) == 1).all()
+    assert (new_boards[:, 1, 1] == -1).all()
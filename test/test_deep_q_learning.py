@@ -0,0 +1,246 @@
+"""
+Contains the unit tests for the deep Q-learning model. The network is
+replaced by a small stub so that the tests do not depend on the training of
+a Keras model.
+"""
+import time
+
+import numpy as np
+import pytest
+
+keras = pytest.importorskip("keras")
+
+from deep_q_learning import DeepQLearningAI
+from batch_game_system import Batch_game_system
+from random_ai import Random_AI
+
+
+class Stub_network:
+    """
+    Stands for the Keras network of DeepQLearningAI: predict returns zeros,
+    and each call to fit is recorded and shifts the biases of the last layer
+    so that the weights change after each training step. The calls to fit
+    made while another one is running are counted as well.
+    """
+
+    def __init__(self):
+        rng = np.random.default_rng(0)
+        self.weights = [
+            rng.normal(size=(9, 12)).astype(np.float32),
+            rng.normal(size=12).astype(np.float32),
+            rng.normal(size=(12, 12)).astype(np.float32),
+            rng.normal(size=12).astype(np.float32),
+            rng.normal(size=(12, 9)).astype(np.float32),
+            rng.normal(size=9).astype(np.float32),
+        ]
+        self.predict_calls = 0
+        self.fit_calls = []
+        self.fitting = False
+        self.concurrent_fits = 0
+
+    def get_weights(self):
+        return [weights.copy() for weights in self.weights]
+
+    def predict(self, states, verbose=0):
+        self.predict_calls += 1
+        return np.zeros((len(states), 9), dtype=np.float32)
+
+    def fit(self, states, targets, sample_weight=None, verbose=0):
+        if self.fitting:
+            self.concurrent_fits += 1
+        self.fitting = True
+        self.fit_calls.append((states, targets, sample_weight))
+        self.weights[-1] += 1
+        time.sleep(0.0001)
+        self.fitting = False
+
+    def save(self, path):
+        return
+
+
+@pytest.fixture
+def stub_network():
+    """
+    Replaces the network shared by the DeepQLearningAI instances with a stub,
+    and restores the class attributes afterwards.
+    """
+    network = Stub_network()
+    DeepQLearningAI.dnn = network
+    DeepQLearningAI.weights = network.get_weights()
+    DeepQLearningAI.weights_version = 0
+    yield network
+    if DeepQLearningAI.trainer is not None:
+        DeepQLearningAI.trainer.stop()
+    DeepQLearningAI.dnn = None
+    DeepQLearningAI.weights = None
+    DeepQLearningAI.weights_version = 0
+    DeepQLearningAI.trainer = None
+
+
+def test_batch_games_without_history(stub_network):
+    """
+    Makes sure that a learning model playing with Batch_game_system, which
+    does not record the moves played, does not try to train on an empty
+    replay memory.
+    """
+    test_ai = DeepQLearningAI(minibatch_size=16)
+    test_ai.batch_size = 10
+    game_system = Batch_game_system(test_ai, Random_AI())
+    game_system.play_games(30)
+
+    assert test_ai.games_played == 30
+    assert stub_network.fit_calls == []
+
+
+def test_train_model(stub_network):
+    """
+    Makes sure that each training step predicts and fits the whole minibatch
+    at once, with only the Q-values of the actions played replaced by their
+    targets.
+    """
+    np.random.seed(0)
+    test_ai = DeepQLearningAI(minibatch_size=32, training_steps=3)
+    for action in range(9):
+        state = np.zeros(9)
+        test_ai.replay_memory.add(state, action, state, action / 10)
+
+    test_ai.train_model()
+
+    assert stub_network.predict_calls == 3
+    assert len(stub_network.fit_calls) == 3
+    for states, targets, sample_weight in stub_network.fit_calls:
+        assert states.shape == targets.shape == (32, 9)
+        assert (sample_weight == 1).all()
+        # Each row of the memory has a single action, whose target is its reward
+        actions = np.argmax(targets, axis=1)
+        assert np.count_nonzero(targets) == np.count_nonzero(actions)
+        assert np.allclose(targets.max(axis=1), actions / 10)
+
+
+def test_predict_q_values(stub_network):
+    """
+    Makes sure that the numpy evaluation of the network gives the same
+    Q-values as Keras, and that it uses the new weights after a training.
+    """
+    network = keras.Sequential(
+        [
+            keras.Input(shape=(9,)),
+            keras.layers.Dense(12, activation="relu"),
+            keras.layers.Dense(12, activation="relu"),
+            keras.layers.Dense(9, activation="linear"),
+        ]
+    )
+    network.set_weights(stub_network.weights)
+    DeepQLearningAI.dnn = network
+    test_ai = DeepQLearningAI()
+    test_ai.refresh_weights()
+
+    states = np.random.default_rng(0).integers(-1, 2, size=(50, 9))
+    expected = network.predict(states.astype(np.float32), verbose=0)
+    assert np.allclose(test_ai.predict_q_values(states), expected, atol=1e-5)
+
+    # The mirrored weights follow the training of the network
+    DeepQLearningAI.dnn = stub_network
+    for action in range(9):
+        test_ai.replay_memory.add(np.zeros(9), action, np.zeros(9), 1)
+    test_ai.minibatch_size = 9
+    test_ai.train_model()
+    assert np.array_equal(DeepQLearningAI.weights[-1], stub_network.weights[-1])
+
+
+def test_background_trainer(stub_network):
+    """
+    Makes sure that the background trainer trains on the moves of the games
+    played, publishes new versions of the weights that the players use from
+    the next game, and stops cleanly.
+    """
+    test_ai = DeepQLearningAI(minibatch_size=8, background_training=True)
+    trainer = DeepQLearningAI.trainer
+    initial_biases = stub_network.get_weights()[-1]
+    assert trainer.snapshot[0] == 0
+
+    for game in range(3):
+        test_ai.game_history = [
+            (np.zeros(9), action, np.zeros(9)) for action in range(4)
+        ]
+        test_ai.notify_game_result(1)
+
+    deadline = time.monotonic() + 10
+    while trainer.snapshot[0] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(trainer.replay_memory) == 12
+
+    # The new weights are picked up at the end of the next game
+    test_ai.notify_game_result(0.5)
+    assert DeepQLearningAI.weights_version >= 2
+    assert (DeepQLearningAI.weights[-1] > initial_biases).all()
+
+    thread = trainer.thread
+    test_ai.stop_background_training()
+    assert not thread.is_alive()
+    assert DeepQLearningAI.trainer is None
+    # The last weights are published when the trainer stops, and used by
+    # all the instances from then on
+    version, weights = trainer.snapshot
+    assert version == trainer.steps // trainer.publish_every_steps + 1
+    assert np.array_equal(weights[-1], stub_network.weights[-1])
+    assert DeepQLearningAI.weights_version == version
+    assert np.array_equal(DeepQLearningAI.weights[-1], stub_network.weights[-1])
+    kernel_1, bias_1, kernel_2, bias_2, kernel_3, bias_3 = stub_network.weights
+    hidden = np.maximum(np.maximum(bias_1, 0) @ kernel_2 + bias_2, 0)
+    assert np.allclose(
+        DeepQLearningAI().predict_q_values(np.zeros((1, 9))),
+        hidden @ kernel_3 + bias_3,
+    )
+
+
+def test_foreground_training_with_trainer(stub_network):
+    """
+    Makes sure that an instance training in the foreground never fits the
+    network at the same time as the background trainer.
+    """
+    background_ai = DeepQLearningAI(minibatch_size=8, background_training=True)
+    background_ai.game_history = [
+        (np.zeros(9), action, np.zeros(9)) for action in range(9)
+    ]
+    background_ai.notify_game_result(1)
+
+    foreground_ai = DeepQLearningAI(minibatch_size=8, training_steps=20)
+    for action in range(9):
+        foreground_ai.replay_memory.add(np.zeros(9), action, np.zeros(9), 1)
+    for _ in range(5):
+        foreground_ai.train_model()
+
+    background_ai.stop_background_training()
+    assert DeepQLearningAI.trainer is None
+    assert len(stub_network.fit_calls) > 100
+    assert stub_network.concurrent_fits == 0
+
+
+def test_play_masks_occupied_boxes(stub_network):
+    """
+    Makes sure that play() and play_batch() only play on empty boxes, even
+    when an occupied box has the highest Q-value, and that they choose the
+    same moves.
+    """
+    test_ai = DeepQLearningAI()
+    test_ai.learning = False
+    rng = np.random.default_rng(0)
+    boards = rng.integers(-1, 2, size=(50, 3, 3)).astype(np.int8)
+    boards[:, 2, 2] = 0
+    # The box with the highest Q-value is taken on every board
+    favourite_box = np.argmax(test_ai.predict_q_values(boards.reshape(50, 9)), axis=1)
+    boards.reshape(50, 9)[np.arange(50), favourite_box] = -1
+    boards[:, 2, 2] = 0
+
+    single_moves = []
+    for board in boards:
+        board.flags.writeable = False
+        new_board = test_ai.play(board)
+        single_moves.append(new_board)
+        assert np.count_nonzero(new_board != board) == 1
+        assert (board[new_board != board] == 0).all()
+        assert (new_board[new_board != board] == 1).all()
+
+    batch_moves = test_ai.play_batch(boards)
+    assert np.array_equal(batch_moves, np.array(single_moves))
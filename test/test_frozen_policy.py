@@ -0,0 +1,68 @@
+"""
+Contains the unit tests for the frozen policies exported from the models.
+"""
+import numpy as np
+
+import solver
+from board_encoding import decode_board, encode_board
+from frozen_policy import Frozen_policy_AI, export_policy, positions_to_play
+from game_system import Game_system
+from improved_q_learning import Improved_q_learning
+from q_learning import QLearningAI
+from random_ai import Random_AI
+
+
+def test_positions_to_play(tmp_path, monkeypatch):
+    """
+    Checks a few positions that a player can or cannot face.
+    """
+    monkeypatch.chdir(tmp_path)
+    positions = set(positions_to_play().tolist())
+    assert encode_board(np.zeros((3, 3))) in positions
+    assert encode_board([[-1, 0, 0], [0, 0, 0], [0, 0, 0]]) in positions
+    assert encode_board([[-1, 1, 0], [0, -1, 0], [0, 0, 0]]) in positions
+    # The opponent already won, or played twice in a row
+    assert encode_board([[-1, -1, -1], [1, 1, 0], [0, 0, 0]]) not in positions
+    assert encode_board([[-1, -1, 0], [0, 0, 0], [0, 0, 0]]) not in positions
+
+
+def test_frozen_policy(tmp_path, monkeypatch, q_learning_state):
+    """
+    Exports the policy of a Q-learning model seeded with the solver, and
+    makes sure that the frozen policy plays the same moves and never loses.
+    """
+    monkeypatch.chdir(tmp_path)
+    solver.write_q_table()
+    model = QLearningAI()
+
+    policy = export_policy(model, "policy.npy")
+    assert model.learning and model.history == []
+    frozen_ai = Frozen_policy_AI("policy.npy")
+    assert np.array_equal(frozen_ai.policy, policy)
+
+    for code in positions_to_play()[::50]:
+        board = decode_board(code)
+        assert np.array_equal(frozen_ai.play(board), model.get_best_move(board)[0])
+
+    boards = np.array([decode_board(code) for code in positions_to_play()[:20]])
+    expected_boards = np.array([frozen_ai.play(board) for board in boards])
+    assert np.array_equal(frozen_ai.play_batch(boards), expected_boards)
+
+    game_system = Game_system(frozen_ai, Random_AI())
+    for _ in range(200):
+        game_system.play_a_game((3, 3))
+    assert game_system.player_1_scores["LOSSES"] == 0
+
+
+def test_export_improved_q_learning(tmp_path, monkeypatch):
+    """
+    Makes sure that the policy of Improved_q_learning can be exported too.
+    """
+    monkeypatch.chdir(tmp_path)
+    solver.write_training_json()
+    model = Improved_q_learning()
+    policy = export_policy(model, "policy.npy")
+    assert model.explore and model.moves_history == []
+
+    board = np.array([[1, 1, 0], [-1, -1, 0], [0, 0, 0]])
+    assert policy[encode_board(board)] == 2
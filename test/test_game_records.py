@@ -0,0 +1,109 @@
+"""
+Contains the unit tests for the game records, i.e. the binary files in which
+the games played are saved.
+"""
+import pytest
+import numpy as np
+
+from game_records import Game_record_writer, Game_record_reader
+from game_system import Game_system
+from random_ai import Random_AI
+from bitboard import Bitboard
+
+
+def test_record_games(tmp_path):
+    """
+    Records games played by the game system, then makes sure that they can be
+    read again and replayed.
+    """
+    path = tmp_path / "games.ttt"
+    with Game_record_writer(path) as recorder:
+        game_system = Game_system(Random_AI(), Random_AI(), recorder=recorder)
+        for i in range(100):
+            game_system.play_a_game((3, 3))
+
+    reader = Game_record_reader(path)
+    assert len(reader) == 100
+    assert np.count_nonzero(reader.results == 1) == game_system.player_1_scores["WINS"]
+    assert np.count_nonzero(reader.results == 0) == game_system.player_1_scores["DRAWS"]
+
+    # Replaying each game must lead to the same result
+    for starting_player, moves, result in reader:
+        bitboard = Bitboard((3, 3))
+        player_nbr = starting_player
+        for move in moves:
+            bitboard.play(int(move), player_nbr)
+            player_nbr = 3 - player_nbr
+        assert bitboard.check_for_endgame() == result
+
+
+def test_append_games(tmp_path):
+    """
+    Makes sure that games are appended to an existing file, and that a file
+    with other board dimensions is rejected.
+    """
+    path = tmp_path / "games.ttt"
+    with Game_record_writer(path) as recorder:
+        recorder.record_game(1, [4, 0, 8], "DRAW")
+    with Game_record_writer(path) as recorder:
+        recorder.record_game(2, [0, 4, 1, 5, 2], 2)
+
+    reader = Game_record_reader(path)
+    assert len(reader) == 2
+    starting_player, moves, result = reader[1]
+    assert starting_player == 2
+    assert moves.tolist() == [0, 4, 1, 5, 2]
+    assert result == 2
+
+    with pytest.raises(ValueError):
+        Game_record_writer(path, board_dimensions=(4, 4))
+
+
+class Double_move_AI(Random_AI):
+    """Breaks the rules by playing two boxes at once on its first move"""
+
+    def __init__(self):
+        super().__init__()
+        self.first_move = True
+
+    def play(self, current_state):
+        new_state = super().play(current_state)
+        if self.first_move and (new_state == 0).any():
+            new_state = super().play(new_state)
+        self.first_move = False
+        return new_state
+
+    def notify_game_result(self, result):
+        self.first_move = True
+
+
+def test_record_loaded_boards(tmp_path):
+    """
+    Makes sure that the boxes played by an AI that broke the rules are
+    recorded as well.
+    """
+    path = tmp_path / "games.ttt"
+    with Game_record_writer(path) as recorder:
+        game_system = Game_system(Double_move_AI(), Random_AI(), recorder=recorder)
+        boards_checked = []
+        for i in range(20):
+            game_system.play_a_game((3, 3))
+            boards_checked.append(np.count_nonzero(game_system.current_board))
+
+    reader = Game_record_reader(path)
+    assert reader.moves_counts.tolist() == boards_checked
+    for (starting_player, moves, result), checked in zip(reader, boards_checked):
+        assert len(set(moves.tolist())) == checked
+
+
+def test_record_mismatched_board(tmp_path):
+    """
+    Makes sure that games which do not fit in the records of the file are
+    rejected.
+    """
+    with Game_record_writer(tmp_path / "games.ttt") as recorder:
+        game_system = Game_system(Random_AI(), Random_AI(), recorder=recorder)
+        with pytest.raises(ValueError):
+            game_system.play_a_game((4, 4))
+        with pytest.raises(ValueError):
+            recorder.record_game(1, list(range(10)), 1)
@@ -0,0 +1,124 @@
+"""
+Contains the unit tests for the game server, which hosts many games at the
+same time.
+"""
+import asyncio
+import json
+import os
+
+import game_server
+import solver
+from game_server import Game_server, run_test_client
+
+
+def test_concurrent_sessions():
+    """
+    Makes sure that several clients can play at the same time and that each
+    of them gets the results of its games.
+    """
+
+    async def play():
+        server = Game_server(port=0)
+        await server.start()
+        try:
+            clients = [
+                run_test_client(server.host, server.port, games_count=5)
+                for i in range(20)
+            ]
+            return await asyncio.gather(*clients)
+        finally:
+            await server.stop()
+
+    all_results = asyncio.run(play())
+
+    assert len(all_results) == 20
+    for results in all_results:
+        assert len(results) == 5
+        assert results[-1]["result"] in (1, 2, "DRAW")
+        assert sum(results[-1]["scores"].values()) == 5
+        assert results[-1]["latency"]["moves"] > 0
+
+
+def test_invalid_game_settings():
+    """
+    Makes sure that invalid board dimensions or line lengths are answered
+    with an error message, and that the client can then start a valid game.
+    """
+
+    async def send_settings(settings_list):
+        server = Game_server(port=0)
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            replies = []
+            for settings in settings_list:
+                message = {"type": "new_game", "opponent": "random", **settings}
+                writer.write(json.dumps(message).encode() + b"\n")
+                await writer.drain()
+                replies.append(json.loads(await reader.readline()))
+            writer.close()
+            await writer.wait_closed()
+            return replies
+        finally:
+            await server.stop()
+
+    invalid_settings = [
+        {"board_dimensions": "ab"},
+        {"board_dimensions": [2, 2, 2]},
+        {"board_dimensions": [20000, 20000]},
+        {"board_dimensions": [0, 3]},
+        {"board_dimensions": [3, True]},
+        {"board_dimensions": [3.5, 3]},
+        {"line_length": "x"},
+        {"line_length": 4},
+        {"line_length": 0},
+    ]
+    replies = asyncio.run(
+        send_settings(invalid_settings + [{"board_dimensions": [4, 4]}])
+    )
+
+    for reply in replies[:-1]:
+        assert reply["type"] == "error"
+    # The connection is still open and the valid game starts
+    assert replies[-1]["type"] in ("board", "game_over")
+    if replies[-1]["type"] == "board":
+        assert len(replies[-1]["board"]) == 4
+
+
+def test_improved_q_learning_opponent(tmp_path, monkeypatch):
+    """
+    Makes sure that the sessions against Improved_q_learning share a single
+    model, and that they never modify its training data.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(game_server, "shared_models", {})
+    solver.write_training_json()
+    modification_time = os.stat("training.json").st_mtime_ns
+    files = sorted(os.listdir(tmp_path))
+
+    async def play():
+        server = Game_server(port=0)
+        await server.start()
+        try:
+            clients = [
+                run_test_client(
+                    server.host,
+                    server.port,
+                    games_count=3,
+                    opponent="improved_q_learning",
+                )
+                for i in range(3)
+            ]
+            return await asyncio.gather(*clients)
+        finally:
+            await server.stop()
+
+    all_results = asyncio.run(play())
+
+    for results in all_results:
+        assert len(results) == 3
+        # The model plays the solved values and never loses
+        assert results[-1]["scores"]["WINS"] == 0
+    assert sorted(os.listdir(tmp_path)) == files
+    assert os.stat("training.json").st_mtime_ns == modification_time
+    assert list(game_server.shared_models) == ["improved_q_learning"]
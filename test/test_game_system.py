@@ -0,0 +1,212 @@
+"""
+Contains the unit tests for the game system, i.e. the module that enforces
+the rules of the game.
+"""
+import random
+import time
+
+import pytest
+import numpy as np
+
+from game_system import Game_system
+from random_ai import Random_AI
+from bitboard import Bitboard
+from instrumentation import Game_instrumentation
+
+
+@pytest.fixture
+def game_system():
+    """
+    Returns a game system with two random AIs.
+    """
+    return Game_system(Random_AI(), Random_AI())
+
+
+def test_check_for_endgame(game_system):
+    """
+    Tests the 'check_for_endgame' method on a few boards.
+    """
+    game_system.current_board = np.array([[1, 1, 1],
+                                          [-1, -1, 0],
+                                          [0, 0, 0]], dtype=np.int8)
+    assert game_system.check_for_endgame() == 1
+
+    game_system.current_board = np.array([[1, 1, -1],
+                                          [0, -1, 0],
+                                          [-1, 0, 1]], dtype=np.int8)
+    assert game_system.check_for_endgame() == 2
+
+    game_system.current_board = np.array([[1, -1, 1],
+                                          [1, -1, -1],
+                                          [-1, 1, 1]], dtype=np.int8)
+    assert game_system.check_for_endgame() == "DRAW"
+
+    game_system.current_board = np.array([[1, -1, 0],
+                                          [0, 0, 0],
+                                          [0, 0, 0]], dtype=np.int8)
+    assert game_system.check_for_endgame() == "CONTINUE"
+
+
+@pytest.mark.parametrize("use_bitboard", [False, True])
+def test_check_for_endgame_after_game(use_bitboard):
+    """
+    Makes sure that a board assigned directly after a game is checked as a
+    whole, and not from the last move of the previous game.
+    """
+    game_system = Game_system(Random_AI(), Random_AI(), bitboard=use_bitboard)
+    game_system.play_a_game((3, 3))
+
+    game_system.current_board = np.array([[1, 1, 1],
+                                          [-1, -1, 0],
+                                          [0, 0, 0]], dtype=np.int8)
+    assert game_system.check_for_endgame() == 1
+
+    game_system.current_board = np.array([[1, -1, 1],
+                                          [1, -1, -1],
+                                          [-1, 1, 1]], dtype=np.int8)
+    assert game_system.check_for_endgame() == "DRAW"
+
+    # The next game starts from an empty board again
+    assert game_system.play_a_game((3, 3))
+
+
+def test_bitboard_matches_ndarray():
+    """
+    Makes sure that the bitboard engine finds the same result as the numpy
+    engine for random boards.
+    """
+    game_system = Game_system(Random_AI(), Random_AI())
+    bitboard = Bitboard((3, 3))
+    rng = np.random.default_rng(0)
+
+    for i in range(500):
+        board = rng.integers(-1, 2, size=(3, 3), dtype=np.int8)
+        game_system.current_board = board
+        bitboard.load_board(board)
+        expected = game_system.check_for_endgame()
+        result = bitboard.check_for_endgame()
+        # A board can contain winning lines for both players, which never
+        # happens in an actual game
+        if expected in (1, 2):
+            assert result in (1, 2)
+        else:
+            assert result == expected
+
+
+def test_bitboard_games():
+    """
+    Makes sure that both engines play exactly the same games given the same seed.
+    """
+    scores = []
+    for use_bitboard in (False, True):
+        random.seed(0)
+        np.random.seed(0)
+        game_system = Game_system(Random_AI(), Random_AI(), bitboard=use_bitboard)
+        for i in range(200):
+            assert game_system.play_a_game((3, 3))
+        scores.append((game_system.player_1_scores, game_system.player_2_scores))
+
+    assert scores[0] == scores[1]
+
+
+def test_incremental_check_matches_scan():
+    """
+    Makes sure that checking only the lines going through the last move gives
+    the same result as scanning the whole board, on a 7x7 board where 4
+    symbols need to be aligned.
+    """
+    random.seed(0)
+    np.random.seed(0)
+    game_system = Game_system(Random_AI(), Random_AI(), line_length=4)
+
+    for i in range(50):
+        game_system.current_board = np.zeros((7, 7), dtype=np.int8)
+        game_system.last_move = None
+        game_system.empty_cells = 49
+        game_system.turn = random.randint(1, 2)
+        result = "CONTINUE"
+        while result == "CONTINUE":
+            game_system.play_one_move()
+            result = game_system.check_for_endgame()
+            last_move = game_system.last_move
+            game_system.last_move = None
+            assert game_system.scan_for_endgame() == result
+            game_system.last_move = last_move
+
+
+def test_board_for_player(game_system):
+    """
+    Tests the 'board_for_player' method, which gives each player the board
+    from its own perspective.
+    """
+    game_system.current_board = np.array([[1, -1, 0],
+                                          [0, 1, 0],
+                                          [0, 0, 0]], dtype=np.int8)
+
+    board_for_player_1 = game_system.board_for_player(1)
+    board_for_player_2 = game_system.board_for_player(2)
+    assert np.array_equal(board_for_player_1, game_system.current_board)
+    assert np.array_equal(board_for_player_2, -game_system.current_board)
+
+    # The views given to the players cannot be modified...
+    with pytest.raises(ValueError):
+        board_for_player_2[2, 2] = 1
+    # ...unless a copy is requested
+    board_copy = game_system.board_for_player(2, copy=True)
+    board_copy[2, 2] = 1
+    assert game_system.current_board[2, 2] == 0
+
+
+def test_instrumentation(tmp_path):
+    """
+    Makes sure that the instrumentation hooks are called for every move and
+    every game.
+    """
+    instrumentation = Game_instrumentation()
+    game_system = Game_system(Random_AI(), Random_AI(), instrumentation=instrumentation)
+    for i in range(50):
+        game_system.play_a_game((3, 3))
+
+    snapshot = instrumentation.snapshot()
+    assert snapshot["games"] == 50
+    assert snapshot["results"][1] == game_system.player_1_scores["WINS"]
+    moves_count = sum(summary["count"] for summary in snapshot["move_latency"].values())
+    assert 5 * 50 <= moves_count <= 9 * 50
+    assert snapshot["move_latency"][1]["p50"] <= snapshot["move_latency"][1]["p99"]
+    # Nothing is displayed without graphics
+    assert snapshot["phase_times"].pop("display") == 0
+    assert all(value > 0 for value in snapshot["phase_times"].values())
+
+    instrumentation.to_csv(tmp_path / "instrumentation.csv")
+    assert (tmp_path / "instrumentation.csv").read_text().startswith("measure,key,value")
+
+
+class Slow_graphics:
+    """Stands for the graphics, with a display that takes 1 ms per update"""
+
+    def update_players_data(self, *players_data):
+        return
+
+    def update_display(self, current_board):
+        time.sleep(0.001)
+
+
+def test_instrumentation_display():
+    """
+    Makes sure that the time spent updating the display is measured apart
+    from the board conversions.
+    """
+    instrumentation = Game_instrumentation()
+    game_system = Game_system(
+        Random_AI(),
+        Random_AI(),
+        graphics=Slow_graphics(),
+        instrumentation=instrumentation,
+    )
+    for i in range(5):
+        game_system.play_a_game((3, 3))
+
+    snapshot = instrumentation.snapshot()
+    moves_count = sum(summary["count"] for summary in snapshot["move_latency"].values())
+    assert snapshot["phase_times"]["display"] >= 0.001 * moves_count
+    assert snapshot["phase_times"]["conversion"] < snapshot["phase_times"]["display"]
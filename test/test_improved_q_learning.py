@@ -7,7 +7,7 @@ import os
 import pytest
 import numpy as np
 
-from improved_q_learning import Improved_q_learning
+from improved_q_learning import Improved_q_learning, Mapped_training_data
 
 @pytest.fixture
 def test_ai():
@@ -134,3 +134,134 @@ def test_write_training_data(test_ai):
 
     assert dummy_training_data == test_ai.training_data
 
+
+def test_training_data_index(test_ai):
+    """
+    Makes sure that the states added to the training data are found again,
+    whatever the type of the arrays used to look them up.
+    """
+    test_ai.training_data = []
+    state = np.array([[1, 0, 0],
+                      [0, -1, 0],
+                      [0, 0, 0]])
+    test_ai.update_training_data(state, 1)
+    test_ai.update_training_data(state.astype(np.int8), 0)
+    test_ai.update_training_data(state.astype(float), 0.5)
+
+    assert len(test_ai.training_data) == 1
+    assert test_ai.training_data[0]["occurences"] == 3
+    assert test_ai.training_data[0]["value"] == 0.5
+
+    # The only known move is played
+    test_ai.exploration_rate = 0
+    new_state = test_ai.play(np.array([[0, 0, 0],
+                                       [0, -1, 0],
+                                       [0, 0, 0]]))
+    assert np.array_equal(new_state, state)
+
+
+def test_training_log(tmp_path):
+    """
+    Makes sure that the states saved in the log after each game are loaded
+    again, and that the log is folded back into the JSON file.
+    """
+    training_file = str(tmp_path / "training.json")
+    test_ai = Improved_q_learning(training_file, compact_every_games=4)
+    states = [np.array([[1, 0, 0], [0, 0, 0], [0, 0, 0]]),
+              np.array([[1, -1, 0], [0, 1, 0], [0, 0, 0]]),
+              np.array([[1, -1, 0], [0, 1, 0], [-1, 0, 1]])]
+
+    # The first save writes the whole training data, the next ones only
+    # append the states played to the log
+    for game_result in (1, 0, 0.5):
+        test_ai.moves_history = [state.copy() for state in states[:2]]
+        test_ai.update_training_scores(game_result)
+        assert len(Improved_q_learning(training_file).training_data) == 2
+    assert os.path.exists(training_file + ".log")
+
+    test_ai.moves_history = [state.copy() for state in states]
+    test_ai.update_training_scores(1)
+    with open(training_file + ".log", "a") as log_file:
+        log_file.write('{"array": [1, 0')
+    loaded_data = Improved_q_learning(training_file).training_data
+    assert len(loaded_data) == 3
+    for state, loaded_state in zip(test_ai.training_data, loaded_data):
+        assert np.array_equal(state["array"], loaded_state["array"])
+        assert state["value"] == loaded_state["value"]
+        assert state["occurences"] == loaded_state["occurences"]
+
+    # Compaction
+    test_ai.moves_history = [states[0].copy()]
+    test_ai.update_training_scores(1)
+    assert not os.path.exists(training_file + ".log")
+    assert Improved_q_learning(training_file).training_data[0]["occurences"] == 5
+
+
+@pytest.mark.parametrize("memory_map", [False, True])
+def test_npz_training_file(tmp_path, memory_map):
+    """
+    Makes sure that the training data can be saved in a .npz file, with the
+    log still replayed after it, and converted back to JSON.
+    """
+    training_file = str(tmp_path / "training.npz")
+    test_ai = Improved_q_learning(training_file)
+    test_ai.training_data = []
+    state = np.array([[1, 0, 0], [0, -1, 0], [0, 0, 0]])
+    test_ai.update_training_data(state, 1)
+    test_ai.update_training_data(-state, 0.5)
+    test_ai.write_training_data()
+    test_ai.update_training_data(state, 0)
+    test_ai.save_training_changes()
+
+    loaded_ai = Improved_q_learning(training_file, memory_map=memory_map)
+    assert len(loaded_ai.training_data) == 2
+    assert np.array_equal(loaded_ai.training_data[1]["array"], -state)
+    assert loaded_ai.training_data[1]["value"] == 0.5
+    assert loaded_ai.training_data[0]["value"] == 0.5
+    assert loaded_ai.training_data[0]["occurences"] == 2
+
+    loaded_ai.write_training_file(str(tmp_path / "training.json"))
+    json_data = Improved_q_learning(str(tmp_path / "training.json")).training_data
+    for state, json_state in zip(loaded_ai.training_data, json_data):
+        assert np.array_equal(state["array"], json_state["array"])
+        assert state["value"] == json_state["value"]
+        assert state["occurences"] == json_state["occurences"]
+
+
+def test_memory_mapped_training_data(tmp_path):
+    """
+    Makes sure that the states of a memory-mapped .npz file are looked up in
+    the mapped arrays, and that the states changed or added afterwards are
+    saved again.
+    """
+    training_file = str(tmp_path / "training.npz")
+    test_ai = Improved_q_learning(training_file)
+    test_ai.training_data = []
+    states = [np.array([[1, 0, 0], [0, -1, 0], [0, 0, 0]]),
+              np.array([[0, 1, 0], [0, -1, 0], [0, 0, 0]]),
+              np.array([[0, 0, 1], [0, -1, 0], [0, 0, 0]])]
+    for value, state in enumerate(states[:2]):
+        test_ai.update_training_data(state, value)
+    test_ai.write_training_data()
+
+    mapped_ai = Improved_q_learning(training_file, memory_map=True)
+    assert isinstance(mapped_ai.training_data, Mapped_training_data)
+    assert len(mapped_ai.training_data) == 2
+    assert mapped_ai.state_indices.get(mapped_ai.state_key(states[1])) == 1
+    assert mapped_ai.state_indices.get(mapped_ai.state_key(states[2])) is None
+    assert np.array_equal(mapped_ai.training_data[-1]["array"], states[1])
+
+    # The only known move is played
+    mapped_ai.exploration_rate = 0
+    new_state = mapped_ai.play(np.array([[0, 0, 0], [0, -1, 0], [0, 0, 0]]))
+    assert np.array_equal(new_state, states[1])
+
+    mapped_ai.update_training_data(states[0], 1)
+    mapped_ai.update_training_data(states[2], 0.5)
+    mapped_ai.update_training_data(states[2], 1)
+    mapped_ai.write_training_data()
+
+    loaded_data = Improved_q_learning(training_file).training_data
+    assert [state["occurences"] for state in loaded_data] == [2, 1, 2]
+    assert [state["value"] for state in loaded_data] == [0.5, 1, 0.75]
+    assert np.array_equal(loaded_data[2]["array"], states[2])
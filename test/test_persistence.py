@@ -0,0 +1,35 @@
+"""
+Contains the unit tests for the helpers used by the models to save their
+training data.
+"""
+import os
+import stat
+
+from persistence import atomic_write, atomic_create
+
+
+def file_mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_file_permissions(tmp_path):
+    """
+    Makes sure that the files written atomically get the default permissions
+    of new files, and keep the permissions of the files they replace.
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+    path = str(tmp_path / "training.json")
+
+    atomic_write(path, lambda json_file: json_file.write("[]"), mode="w")
+    assert file_mode(path) == 0o666 & ~umask
+
+    os.chmod(path, 0o640)
+    atomic_write(path, lambda json_file: json_file.write("[1]"), mode="w")
+    assert file_mode(path) == 0o640
+    with open(path) as json_file:
+        assert json_file.read() == "[1]"
+
+    created_path = str(tmp_path / "q_table.npy")
+    assert atomic_create(created_path, lambda npy_file: npy_file.write(b"0"))
+    assert file_mode(created_path) == 0o666 & ~umask
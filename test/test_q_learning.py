@@ -0,0 +1,210 @@
+"""
+Contains the unit tests for the Q-learning model, i.e. the original
+model of the project.
+"""
+import os
+import pickle
+import multiprocessing
+
+import pytest
+import numpy as np
+
+import board_encoding
+from q_learning import QLearningAI
+from board_encoding import encode_board, decode_board, successor_graph
+from game_system import Game_system
+from random_ai import Random_AI
+
+
+@pytest.fixture
+def test_ai(tmp_path, monkeypatch, q_learning_state):
+    """
+    Returns an instance of the AI to use for testing, with its training data
+    saved in a temporary folder.
+    """
+    monkeypatch.chdir(tmp_path)
+    return QLearningAI()
+
+
+def test_encode_board():
+    """
+    Makes sure that a board can be found back from its code.
+    """
+    board = np.array([[-1, 0, 1],
+                      [0, 1, 0],
+                      [-1, 0, 0]])
+    assert np.array_equal(decode_board(encode_board(board)), board)
+    assert encode_board(np.zeros((3, 3))) == 0
+
+
+def test_get_all_possible_moves(test_ai):
+    """
+    Tests the 'get_all_possible_moves' method.
+    """
+    current_state = np.array([[-1, 0, 0],
+                              [0, 1, 0],
+                              [-1, 1, -1]])
+    QLearningAI.q_table[encode_board(np.array([[-1, 1, 0],
+                                                [0, 1, 0],
+                                                [-1, 1, -1]]))] = 0.9
+
+    moves, values = test_ai.get_all_possible_moves(current_state)
+
+    assert len(moves) == len(values) == 4
+    assert np.array_equal(moves[0], [[-1, 1, 0], [0, 1, 0], [-1, 1, -1]])
+    assert values[0] == 0.9
+    assert np.array_equal(test_ai.get_best_move(current_state)[0], moves[0])
+
+
+def test_successor_graph(test_ai, monkeypatch):
+    """
+    Compares the successor graph with the states found by playing each
+    possible move of the opponent, then each possible move of the model.
+    """
+    board = np.array([[-1, 0, 1],
+                      [0, 1, 0],
+                      [-1, 0, 0]])
+    expected_followups = []
+    for opponent_cell in np.flatnonzero(board.ravel() == 0):
+        reply = board.copy()
+        reply.flat[opponent_cell] = -1
+        for cell in np.flatnonzero(reply.ravel() == 0):
+            followup = reply.copy()
+            followup.flat[cell] = 1
+            expected_followups.append(encode_board(followup))
+
+    # The graph is built again instead of being taken from a previous test
+    monkeypatch.setattr(board_encoding, "successor_graph_arrays", None)
+    graph = successor_graph()
+    code = encode_board(board)
+    replies = graph["reply_codes"][
+        graph["reply_ptr"][code]:graph["reply_ptr"][code + 1]
+    ]
+    followups = graph["followup_codes"][
+        graph["followup_ptr"][code]:graph["followup_ptr"][code + 1]
+    ]
+    assert len(replies) == 5
+    assert followups.tolist() == expected_followups
+
+    # The graph is cached on disk after being built
+    assert os.path.exists("training_data/successor_graph_v1.npz")
+
+    QLearningAI.q_table[expected_followups[7]] = 0.9
+    best_state, best_value = test_ai.find_best_next_state(board)
+    assert encode_board(best_state) == expected_followups[7]
+    assert best_value == 0.9
+
+
+def test_initial_q_table(test_ai):
+    """
+    Compares the vectorized initial q-table with the values given by
+    'check_for_endgame' on each legal board.
+    """
+    # The initial table is saved when the model is created for the first time
+    assert os.path.exists("training_data/q_learning_initial_v1.npz")
+
+    q_table = test_ai.build_initial_q_table()
+    expected_values = {-1: 0, 0: 0.5, 1: 1, 2: 0.5}
+    for code in range(0, len(q_table), 7):
+        board = decode_board(code)
+        if board.sum() in (0, 1):
+            assert q_table[code] == expected_values[test_ai.check_for_endgame(board)]
+        else:
+            assert np.isnan(q_table[code])
+    assert np.array_equal(
+        test_ai.generate_initial_q_table(), q_table, equal_nan=True
+    )
+
+
+def test_load_legacy_training_data(test_ai):
+    """
+    Makes sure that the Q-tables saved as a list of arrays and a list of
+    values are converted when loaded.
+    """
+    state = np.array([[1, 1, -1],
+                      [0, -1, 1],
+                      [0, 0, -1]])
+    with open("training_data/q_learning.pkl", "wb") as training_data:
+        pickle.dump([[state], [0.25]], training_data)
+
+    q_table = test_ai.load_training_data()
+
+    assert q_table[encode_board(state)] == 0.25
+    assert np.count_nonzero(~np.isnan(q_table)) == 1
+
+
+def test_symmetry(tmp_path, monkeypatch, q_learning_state):
+    """
+    Makes sure that rotations and reflections of a board share the same
+    entry of a symmetry-reduced q-table.
+    """
+    monkeypatch.chdir(tmp_path)
+    test_ai = QLearningAI(symmetry=True)
+
+    assert np.count_nonzero(~np.isnan(QLearningAI.q_table)) == 850
+
+    current_state = np.array([[-1, 0, 0],
+                              [0, 1, 0],
+                              [0, 0, 0]])
+    best_move, best_value = test_ai.get_best_move(current_state)
+    QLearningAI.q_table[test_ai.table_index(encode_board(best_move))] = 0.9
+    rotated_move, rotated_value = test_ai.get_best_move(np.rot90(current_state))
+
+    # The best move is found in the orientation of the board given
+    assert np.array_equal(rotated_move, np.rot90(best_move))
+    assert rotated_value == 0.9
+
+    # Mixing symmetry-reduced and full tables is not allowed
+    with pytest.raises(ValueError):
+        QLearningAI(symmetry=False)
+
+
+def test_checkpoint(test_ai):
+    """
+    Makes sure that the q-table saved through the checkpoints (full snapshot
+    plus journal) is the same as the one in memory.
+    """
+    test_ai.checkpoint_policy.every_games = 1
+    game_system = Game_system(test_ai, Random_AI())
+    for i in range(20):
+        game_system.play_a_game((3, 3))
+
+    # Only the entries updated after each game are appended to the journal
+    assert os.path.exists(test_ai.journal_path)
+    assert not QLearningAI.dirty_codes
+
+    q_table = QLearningAI.q_table.copy()
+    assert np.array_equal(test_ai.load_training_data(), q_table, equal_nan=True)
+
+    # A full save folds the journal into the pickle file
+    test_ai.save_training_data()
+    assert not os.path.exists(test_ai.journal_path)
+    assert np.array_equal(test_ai.load_training_data(), q_table, equal_nan=True)
+
+
+def update_shared_entry(path, code, value):
+    """
+    Updates an entry of a memory-mapped q-table from another process.
+    """
+    QLearningAI(shared_table_path=path)
+    QLearningAI.q_table[code] = value
+
+
+def test_shared_q_table(tmp_path, monkeypatch, q_learning_state):
+    """
+    Makes sure that the updates made by a process to a memory-mapped q-table
+    are seen by the other processes.
+    """
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "q_table.npy")
+    QLearningAI(shared_table_path=path)
+    assert QLearningAI.q_table[0] == 0.5
+
+    process = multiprocessing.get_context("spawn").Process(
+        target=update_shared_entry, args=(path, 0, 0.75)
+    )
+    process.start()
+    process.join()
+
+    assert process.exitcode == 0
+    assert QLearningAI.q_table[0] == 0.75
@@ -0,0 +1,89 @@
+"""
+Contains the unit tests for the replay memory of the deep Q-learning model.
+"""
+import numpy as np
+import pytest
+
+from replay_memory import Replay_memory
+
+
+def test_add():
+    """
+    Makes sure that the oldest experiences are replaced once the memory is
+    full.
+    """
+    replay_memory = Replay_memory(capacity=3)
+    for action in range(5):
+        state = np.full((3, 3), action % 2)
+        replay_memory.add(state, action, -state, action / 10)
+
+    assert len(replay_memory) == 3
+    assert sorted(replay_memory.actions.tolist()) == [2, 3, 4]
+    assert replay_memory.next_index == 2
+    assert np.array_equal(replay_memory.next_states[0], np.full(9, -1))
+
+
+def test_sample():
+    """
+    Tests the uniform and the prioritized sampling.
+    """
+    np.random.seed(0)
+    replay_memory = Replay_memory(capacity=10)
+    for action in range(4):
+        replay_memory.add(np.zeros(9), action, np.zeros(9), 0.5)
+
+    indices, states, actions, next_states, rewards, weights = replay_memory.sample(8)
+    assert states.shape == next_states.shape == (8, 9)
+    assert np.array_equal(actions, indices)
+    assert (rewards == 0.5).all() and (weights == 1).all()
+
+    # Only the experience with a large error is likely to be sampled
+    replay_memory.update_priorities(np.arange(4), np.array([0, 0, 100, 0]))
+    indices, *_, weights = replay_memory.sample(50, prioritized=True)
+    assert np.count_nonzero(indices == 2) > 45
+    assert weights.max() == 1 and (weights > 0).all()
+
+
+def test_wraparound():
+    """
+    Makes sure that the memory keeps the last experiences in the right slots
+    after being filled several times, and only samples those.
+    """
+    np.random.seed(0)
+    replay_memory = Replay_memory(capacity=4)
+    for action in range(10):
+        state = np.full(9, action)
+        replay_memory.add(state, action, state, action)
+
+    assert len(replay_memory) == 4
+    assert replay_memory.next_index == 2
+    assert replay_memory.actions.tolist() == [8, 9, 6, 7]
+    assert replay_memory.states[:, 0].tolist() == [8, 9, 6, 7]
+
+    indices, states, actions, next_states, rewards, weights = replay_memory.sample(
+        100, prioritized=True
+    )
+    assert set(actions.tolist()) == {6, 7, 8, 9}
+    assert np.array_equal(states[:, 0], actions)
+    assert np.array_equal(rewards, actions)
+
+
+def test_sample_small_memory():
+    """
+    Tests the sampling of an empty memory, and of a memory holding fewer
+    experiences than the size of the minibatch.
+    """
+    replay_memory = Replay_memory(capacity=10)
+    for prioritized in (False, True):
+        with pytest.raises(ValueError):
+            replay_memory.sample(4, prioritized=prioritized)
+
+    replay_memory.add(np.zeros(9), 5, np.zeros(9), 1)
+    for prioritized in (False, True):
+        indices, states, actions, *_, weights = replay_memory.sample(
+            8, prioritized=prioritized
+        )
+        # The only experience is sampled again and again
+        assert states.shape == (8, 9)
+        assert (indices == 0).all() and (actions == 5).all()
+        assert (weights == 1).all()
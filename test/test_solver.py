@@ -0,0 +1,75 @@
+"""
+Contains the unit tests for the exact solver used to seed the tabular
+models.
+"""
+import numpy as np
+
+import solver
+from board_encoding import encode_board
+from game_system import Game_system
+from improved_q_learning import Improved_q_learning
+from q_learning import QLearningAI
+from random_ai import Random_AI
+
+
+def minimax(board):
+    """
+    Returns the value of a board for the player who just played (1 = player,
+    -1 = opponent, who plays next) by exploring the whole game tree.
+    """
+    for line in ((0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6),
+                 (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6)):
+        if abs(board.flat[list(line)].sum()) == 3:
+            return (board.flat[line[0]] + 1) / 2
+    if not (board == 0).any():
+        return 0.5
+
+    # The opponent plays, seen as the player after flipping the board
+    opponent_values = []
+    for cell in np.flatnonzero(board.ravel() == 0):
+        reply = -board
+        reply.flat[cell] = 1
+        opponent_values.append(minimax(reply))
+    return 1 - max(opponent_values)
+
+
+def test_solve(tmp_path, monkeypatch):
+    """
+    Compares the solved values with a plain minimax search.
+    """
+    monkeypatch.chdir(tmp_path)
+    values = solver.solve()
+    boards = [
+        np.array([[1, 0, 0], [0, 0, 0], [0, 0, 0]]),
+        np.array([[-1, 0, 0], [0, 1, 0], [0, 0, 0]]),
+        np.array([[0, 1, 0], [0, 0, 0], [-1, 0, 0]]),
+        np.array([[1, 1, 0], [-1, -1, 0], [0, 0, 0]]),
+        np.array([[1, -1, 0], [0, 1, 0], [-1, 0, 0]]),
+        np.array([[1, -1, 1], [0, -1, 0], [0, 1, 0]]),
+    ]
+    for board in boards:
+        assert values[encode_board(board)] == minimax(board)
+
+
+def test_seeded_models(tmp_path, monkeypatch, q_learning_state):
+    """
+    Makes sure that the models seeded with the solved values never lose.
+    """
+    monkeypatch.chdir(tmp_path)
+    solver.write_q_table()
+    solver.write_training_json()
+
+    q_learning_ai = QLearningAI()
+    q_learning_ai.learning = False
+    improved_ai = Improved_q_learning()
+    improved_ai.explore = False
+    # All the states reachable in a game are known
+    assert len(improved_ai.training_data) == len(solver.reachable_states())
+    # The values should not be changed by the games played
+    improved_ai.update_training_scores = lambda game_result: None
+
+    for player in (q_learning_ai, improved_ai):
+        game_system = Game_system(player, Random_AI())
+        for _ in range(200):
+            game_system.play_a_game((3, 3))
+        assert game_system.player_1_scores["LOSSES"] == 0
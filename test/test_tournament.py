@@ -0,0 +1,96 @@
+"""
+Contains the unit tests for the tournament runner, which plays games on
+several processes.
+"""
+import os
+
+import numpy as np
+
+import solver
+from tournament import run_tournament, run_self_play
+from improved_q_learning import Improved_q_learning, merge_training_data
+from random_ai import Random_AI
+from testing_ai import Testing_AI
+
+
+def test_run_tournament():
+    """
+    Makes sure that all the games are played and that the results are the
+    same when the tournament is run twice with the same seed.
+    """
+    scores = run_tournament(Random_AI, Testing_AI, 300, workers=2, seed=42)
+    assert sum(scores[0].values()) == 300
+    assert scores[0]["WINS"] == scores[1]["LOSSES"]
+    assert scores[0]["DRAWS"] == scores[1]["DRAWS"]
+
+    assert run_tournament(Random_AI, Testing_AI, 300, workers=2, seed=42) == scores
+
+
+def test_run_tournament_without_learning(tmp_path, monkeypatch):
+    """
+    Makes sure that an Improved_q_learning model whose learning is disabled
+    leaves its training file untouched, so that the results only depend on
+    the seed.
+    """
+    monkeypatch.chdir(tmp_path)
+    solver.write_training_json()
+    modification_time = os.stat("training.json").st_mtime_ns
+    files = sorted(os.listdir(tmp_path))
+
+    settings = {"learning": False, "explore": False}
+    scores = run_tournament(
+        Improved_q_learning,
+        Random_AI,
+        40,
+        workers=2,
+        seed=0,
+        player_1_settings=settings,
+    )
+    assert sum(scores[0].values()) == 40
+    assert scores[0]["LOSSES"] == 0
+    assert sorted(os.listdir(tmp_path)) == files
+    assert os.stat("training.json").st_mtime_ns == modification_time
+
+    assert run_tournament(
+        Improved_q_learning,
+        Random_AI,
+        40,
+        workers=2,
+        seed=0,
+        player_1_settings=settings,
+    ) == scores
+
+
+def test_run_self_play(tmp_path):
+    """
+    Makes sure that the results of all the games played by the workers are
+    merged into the training data.
+    """
+    training_file = str(tmp_path / "training.json")
+    scores = run_self_play(
+        40, workers=2, seed=0, training_file=training_file, rounds=2
+    )
+    assert sum(scores[0].values()) == 40
+
+    # Every move played counts as one occurence of a state, and the shards
+    # are deleted once merged
+    training_data = Improved_q_learning(training_file).training_data
+    moves_count = sum(state["occurences"] for state in training_data)
+    assert 40 * 5 <= moves_count <= 40 * 9
+    assert os.listdir(tmp_path) == ["training.json"]
+
+
+def test_merge_training_data():
+    """
+    Tests the occurence-weighted merge of the training data.
+    """
+    state = np.zeros((3, 3))
+    merged_data = merge_training_data(
+        [[{"array": state, "value": 1.0, "occurences": 3}],
+         [{"array": state.astype(np.int8), "value": 0.2, "occurences": 1},
+          {"array": -state - 1, "value": 0.5, "occurences": 2}]]
+    )
+    assert len(merged_data) == 2
+    assert merged_data[0]["occurences"] == 4
+    assert merged_data[0]["value"] == 0.8
+    assert merged_data[1]["occurences"] == 2
@@ -0,0 +1,211 @@
+"""
+Plays a large number of games between two models on several processes.
+
+The games are split into shards, each shard being played by a worker
+process with its own Game_system and its own random seed. The scores of all
+the shards are then merged. For a given seed and number of workers, the
+results are always the same.
+
+run_self_play trains Improved_q_learning the same way: each worker saves
+the results of its games in its own shard files, which are merged into the
+training data at the end of each round.
+"""
+
+import functools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from game_system import Game_system
+from improved_q_learning import Improved_q_learning, merge_training_shards
+
+
+def play_shard(
+    player_1_class,
+    player_2_class,
+    games_count,
+    seed,
+    player_1_settings=None,
+    player_2_settings=None,
+    board_dimensions=(3, 3),
+):
+    """
+    Plays games_count games in the current process and returns the scores of
+    both players.
+
+    player_1_class and player_2_class are called without arguments to create
+    the players (use functools.partial to give hyperparameters), then the
+    attributes given in player_1_settings and player_2_settings are set on
+    them, e.g. {"learning": False}.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+
+    player_1 = player_1_class()
+    player_2 = player_2_class()
+    for player, settings in (
+        (player_1, player_1_settings),
+        (player_2, player_2_settings),
+    ):
+        for attribute, value in (settings or {}).items():
+            setattr(player, attribute, value)
+
+    game_system = Game_system(player_1, player_2)
+    for i in range(games_count):
+        game_system.play_a_game(board_dimensions)
+
+    return game_system.player_1_scores, game_system.player_2_scores
+
+
+def run_tournament(
+    player_1_class,
+    player_2_class,
+    games_count,
+    workers=None,
+    seed=0,
+    player_1_settings=None,
+    player_2_settings=None,
+    board_dimensions=(3, 3),
+):
+    """
+    Plays games_count games between two models, split between 'workers'
+    processes (one per CPU by default). See play_shard for the description
+    of the parameters.
+
+    Returns the merged scores of both players, as dictionaries with the same
+    format as Game_system.player_1_scores and Game_system.player_2_scores.
+
+    Models that save their training data after each game (e.g.
+    Improved_q_learning) write to the same files from all the workers, so
+    their learning should be disabled with {"learning": False} in the
+    settings (see run_self_play to train Improved_q_learning on several
+    processes). QLearningAI models
+    created with a shared_table_path can keep learning: all the workers then
+    train the same memory-mapped q-table.
+    """
+    shard_sizes, shard_seeds = split_games(games_count, workers, seed)
+
+    with ProcessPoolExecutor(max_workers=len(shard_sizes)) as executor:
+        shards = [
+            executor.submit(
+                play_shard,
+                player_1_class,
+                player_2_class,
+                shard_size,
+                shard_seed,
+                player_1_settings,
+                player_2_settings,
+                board_dimensions,
+            )
+            for shard_size, shard_seed in zip(shard_sizes, shard_seeds)
+        ]
+        shard_scores = [shard.result() for shard in shards]
+
+    return merge_scores(shard_scores)
+
+
+def run_self_play(
+    games_count,
+    workers=None,
+    seed=0,
+    training_file="training.json",
+    rounds=1,
+    board_dimensions=(3, 3),
+):
+    """
+    Trains Improved_q_learning by playing games_count games against itself,
+    split between 'workers' processes (one per CPU by default).
+
+    The games are played in 'rounds' successive rounds. During a round, both
+    players of each worker read the training data from training_file and
+    save the results of their games in their own shard file. At the end of
+    the round, all the shards are merged into training_file, so that every
+    game counts and the next round starts from the results of all the
+    workers.
+
+    Returns the merged scores of both players, like run_tournament.
+    """
+    training_root, training_extension = os.path.splitext(training_file)
+    round_sizes, round_seeds = split_games(games_count, rounds, seed)
+
+    round_scores = []
+    for round_size, round_seed in zip(round_sizes, round_seeds):
+        shard_sizes, shard_seeds = split_games(round_size, workers, round_seed)
+        shard_files = []
+        with ProcessPoolExecutor(max_workers=len(shard_sizes)) as executor:
+            shards = []
+            for worker, (shard_size, shard_seed) in enumerate(
+                zip(shard_sizes, shard_seeds)
+            ):
+                players = []
+                for player_nbr in (1, 2):
+                    # e.g. training.shard0-1.json for player 1 of worker 0
+                    shard_name = f"shard{worker}-{player_nbr}"
+                    shard_file = f"{training_root}.{shard_name}{training_extension}"
+                    shard_files.append(shard_file)
+                    players.append(
+                        functools.partial(
+                            Improved_q_learning, training_file, shard_file=shard_file
+                        )
+                    )
+                shards.append(
+                    executor.submit(
+                        play_shard,
+                        players[0],
+                        players[1],
+                        shard_size,
+                        shard_seed,
+                        board_dimensions=board_dimensions,
+                    )
+                )
+            round_scores.append(
+                merge_scores([shard.result() for shard in shards])
+            )
+
+        merge_training_shards(training_file, shard_files)
+
+    return merge_scores(round_scores)
+
+
+def split_games(games_count, workers, seed):
+    """
+    Splits games_count games as evenly as possible between 'workers' shards
+    (one per CPU by default), and derives a seed for each shard from 'seed'.
+    Returns the number of games and the seed of each shard.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    workers = max(1, min(workers, games_count))
+
+    shard_sizes = [
+        games_count // workers + (1 if i < games_count % workers else 0)
+        for i in range(workers)
+    ]
+    shard_seeds = [
+        int(seed_sequence.generate_state(1)[0])
+        for seed_sequence in np.random.SeedSequence(seed).spawn(workers)
+    ]
+    return shard_sizes, shard_seeds
+
+
+def merge_scores(shard_scores):
+    """Sums the scores of both players over several shards"""
+    player_1_scores = {"WINS": 0, "LOSSES": 0, "DRAWS": 0}
+    player_2_scores = {"WINS": 0, "LOSSES": 0, "DRAWS": 0}
+    for shard_player_1_scores, shard_player_2_scores in shard_scores:
+        for key in player_1_scores:
+            player_1_scores[key] += shard_player_1_scores[key]
+            player_2_scores[key] += shard_player_2_scores[key]
+
+    return player_1_scores, player_2_scores
+
+
+if __name__ == "__main__":
+    from random_ai import Random_AI
+    from testing_ai import Testing_AI
+
+    scores = run_tournament(Testing_AI, Random_AI, 10000, seed=0)
+    print(f"Testing AI: {scores[0]}")
+    print(f"Random AI: {scores[1]}")
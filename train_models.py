@@ -81,6 +81,8 @@ def train_model(model="original", games_count=1000, **hyperparameters):
     # Deleting previous training data
     with open("training.json", 'w') as _:
         pass
+    if os.path.exists("training.json.log"):
+        os.remove("training.json.log")
 
     games_played = 0
     starting_time = time()
@@ -141,6 +143,8 @@ def finetune_q_learning():
         print(f"epsilon = {epsilon}")
         train_model(model="q-learning", games_count=1401, alpha=alpha, gamma=gamma, epsilon=epsilon)
         os.remove("training_data/q_learning.pkl")
+        if os.path.exists("training_data/q_learning.pkl.journal"):
+            os.remove("training_data/q_learning.pkl.journal")
 
 def finetune_deep_q_learning():
     """